@@ -1,9 +1,14 @@
 import logging
 import os
 import json
+import uuid
+import threading
 import psycopg2
-from psycopg2.extras import execute_values
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+import psycopg2.errors
+from psycopg2.pool import ThreadedConnectionPool
+from psycopg2.extras import execute_values, RealDictCursor
+from typing import Dict, Any, Iterator, Optional
 from config.config import config
 
 # Ensure logs directory exists
@@ -23,26 +28,196 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Indexes backing the pipeline's hot queries; created once per process by ensure_indexes()
+PIPELINE_INDEXES = [
+    # Anti-join probe for documents already indexed into RAG
+    """
+    CREATE INDEX IF NOT EXISTS idx_pp_rag_docid
+    ON processing_pipeline (document_id) WHERE pipeline_stage = 'rag';
+    """,
+]
+_indexes_ensured = False
+
+# Shared connection pool for short units of work (see borrow_connection);
+# created lazily on first use
+DB_POOL_MIN_CONN = 1
+DB_POOL_MAX_CONN = 16
+# Seconds a borrower waits for a pooled connection before opening a dedicated one
+DB_POOL_WAIT_SECONDS = 30
+_db_pool = None
+_db_pool_lock = threading.Lock()
+# ThreadedConnectionPool raises instead of blocking when exhausted, so checkouts
+# are counted here and borrowers wait for a free slot
+_db_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX_CONN)
+
+def _connect():
+    """Open a dedicated (unpooled) database connection."""
+    return psycopg2.connect(
+        dbname=config.DB_NAME,
+        user=config.DB_USER,
+        password=config.DB_PASSWORD,
+        host=config.DB_HOST,
+        port=config.DB_PORT
+    )
+
+def get_db_pool() -> ThreadedConnectionPool:
+    """Return the process-wide connection pool, creating it on first call."""
+    global _db_pool
+    if _db_pool is None:
+        with _db_pool_lock:
+            if _db_pool is None:
+                _db_pool = ThreadedConnectionPool(
+                    DB_POOL_MIN_CONN,
+                    DB_POOL_MAX_CONN,
+                    dbname=config.DB_NAME,
+                    user=config.DB_USER,
+                    password=config.DB_PASSWORD,
+                    host=config.DB_HOST,
+                    port=config.DB_PORT
+                )
+    return _db_pool
+
+def borrow_connection(wait: float = DB_POOL_WAIT_SECONDS):
+    """
+    Take a connection from the shared pool, waiting up to `wait` seconds for one to free up.
+    
+    If the pool stays exhausted, a dedicated connection is opened instead.
+    
+    Returns:
+        tuple: (connection, pooled); pass both to release_connection
+    """
+    if _db_pool_slots.acquire(timeout=wait):
+        try:
+            return get_db_pool().getconn(), True
+        except Exception:
+            _db_pool_slots.release()
+            raise
+    logger.warning("⚠️ Connection pool exhausted, opening a dedicated connection.")
+    return _connect(), False
+
+def release_connection(conn, pooled: bool):
+    """Return a connection from borrow_connection to the pool, or close it if dedicated."""
+    if not pooled:
+        conn.close()
+        return
+    try:
+        get_db_pool().putconn(conn)
+    finally:
+        _db_pool_slots.release()
+
 class DBManager:
     """Handles database operations for the document processing pipeline."""
 
-    def __init__(self):
-        """Initialize the database connection."""
+    def __init__(self, pooled: bool = False):
+        """
+        Initialize the database connection.
+        
+        Args:
+            pooled: Borrow the connection from the shared pool (when a slot is
+                free right away) instead of opening a dedicated one. Only for
+                short-lived managers that call close_connection; module-level
+                managers would otherwise hold a pool slot for the whole process.
+        """
+        self.prepared_statements = set()
+        self.pooled = False
         try:
-            self.conn = psycopg2.connect(
-                dbname=config.DB_NAME,
-                user=config.DB_USER,
-                password=config.DB_PASSWORD,
-                host=config.DB_HOST,
-                port=config.DB_PORT
-            )
+            if pooled:
+                self.conn, self.pooled = borrow_connection(wait=0)
+            else:
+                self.conn = _connect()
             self.conn.autocommit = True  # 🔥 Ensure autocommit is enabled
             self.cursor = self.conn.cursor()
+            self.dict_cursor = self.conn.cursor(cursor_factory=RealDictCursor)  # Rows come back as dicts
             
             logger.info("✅ Database connection established.")
         except Exception as e:
             logger.error(f"❌ Failed to connect to database: {e}")
 
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a pooled connection for one unit of work.
+        
+        Gives each worker thread its own connection instead of sharing self.cursor.
+        Waits for a free pool slot (see borrow_connection). Commits on success,
+        rolls back on error and always returns the connection.
+        """
+        conn, pooled = borrow_connection()
+        try:
+            conn.autocommit = False
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            release_connection(conn, pooled)
+
+    def prepare_statement(self, name: str, statement: str) -> bool:
+        """Server-side PREPARE a statement once per connection so repeated EXECUTEs skip parse/plan."""
+        if name in self.prepared_statements:
+            return True
+        try:
+            self.cursor.execute(f"PREPARE {name} AS {statement}")
+            self.prepared_statements.add(name)
+            return True
+        except psycopg2.errors.DuplicatePreparedStatement:
+            # Pooled connection was already prepared by a previous borrower
+            if not self.conn.autocommit:
+                self.conn.rollback()
+            self.prepared_statements.add(name)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to prepare statement {name}: {e}")
+            self.conn.rollback()
+            return False
+
+    def ensure_indexes(self) -> bool:
+        """Create the pipeline's supporting indexes if they don't exist (once per process)."""
+        global _indexes_ensured
+        if _indexes_ensured:
+            return True
+        try:
+            for statement in PIPELINE_INDEXES:
+                self.cursor.execute(statement)
+            self.conn.commit()
+            _indexes_ensured = True
+            return True
+        except Exception as e:
+            logger.error(f"❌ Failed to create pipeline indexes: {e}")
+            self.conn.rollback()
+            return False
+
+    def iter_documents_for_stage(self, stage: str, status: str = "completed", limit: Optional[int] = None,
+                                 batch: int = 500) -> Iterator[Dict[str, Any]]:
+        """
+        Yield documents that reached a pipeline stage but are not indexed into RAG yet.
+        
+        Indexing marks documents through rag_data->>'indexed' rather than a 'rag'
+        pipeline entry, so both are checked; otherwise every run would re-index
+        every document.
+        
+        Rows stream from a server-side cursor `batch` at a time, so memory stays
+        flat however many documents match. The cursor is WITH HOLD because the
+        connection is in autocommit mode.
+        """
+        cursor_name = f"docs_for_stage_{uuid.uuid4().hex}"
+        with self.conn.cursor(name=cursor_name, cursor_factory=RealDictCursor, withhold=True) as cursor:
+            cursor.itersize = batch
+            cursor.execute("""
+                SELECT d.id, d.name, d.metadata, d.document_type_id, d.batch_id
+                FROM documents d
+                JOIN processing_pipeline pp ON d.id = pp.document_id
+                LEFT JOIN processing_pipeline rag
+                  ON rag.document_id = d.id AND rag.pipeline_stage = 'rag'
+                WHERE pp.pipeline_stage = %s AND pp.status = %s
+                AND rag.document_id IS NULL
+                AND (d.rag_data IS NULL OR d.rag_data->>'indexed' IS NULL)
+                LIMIT %s;
+            """, (stage, status, limit))
+            
+            yield from cursor
+
     def get_document_type(self, document_id: str) -> Optional[str]:
         """Fetch document type given a document ID."""
         try:
@@ -63,24 +238,23 @@ class DBManager:
     def update_pipeline_status(self, document_id: str, pipeline_stage: str, status: str, error_message: Optional[str] = None):
         """Update document processing status in the pipeline, ensuring document_type_id is set."""
         try:
-            # ✅ Ensure document_type_id is retrieved before updating pipeline
-            self.cursor.execute("SELECT document_type_id FROM documents WHERE id = %s;", (document_id,))
-            result = self.cursor.fetchone()
-    
-            if not result or result[0] is None:
-                logger.error(f"❌ Cannot update pipeline: document_type_id is NULL for document {document_id}")
-                return
-    
-            document_type_id = result[0]
-    
+            # ✅ document_type_id and batch_id come from the same write; no separate lookup
             query = """
                 INSERT INTO processing_pipeline (document_id, document_type_id, pipeline_stage, status, error_message, batch_id, updated_at)
-                VALUES (%s, %s, %s, %s, %s, (SELECT batch_id FROM documents WHERE id = %s), NOW())
+                SELECT d.id, d.document_type_id, %s, %s, %s, d.batch_id, NOW()
+                FROM documents d
+                WHERE d.id = %s AND d.document_type_id IS NOT NULL
                 ON CONFLICT (document_id, pipeline_stage) DO UPDATE 
-                SET status = EXCLUDED.status, error_message = EXCLUDED.error_message, updated_at = NOW();
+                SET status = EXCLUDED.status, error_message = EXCLUDED.error_message, updated_at = NOW()
+                RETURNING document_id;
             """
-            self.cursor.execute(query, (document_id, document_type_id, pipeline_stage, status, error_message, document_id))
+            self.cursor.execute(query, (pipeline_stage, status, error_message, document_id))
             self.conn.commit()
+    
+            if self.cursor.rowcount == 0:
+                logger.error(f"❌ Cannot update pipeline: document_type_id is NULL for document {document_id}")
+                return
+    
             logger.info(f"✅ Updated pipeline status: {document_id} | {pipeline_stage} → {status}")
     
         except Exception as e:
@@ -150,12 +324,15 @@ class DBManager:
             return []
 
     def close_connection(self):
-        """Close the database connection."""
+        """Close the cursors and return the connection to the pool (or close it if unpooled)."""
         try:
             if self.cursor:
                 self.cursor.close()
+            if self.dict_cursor:
+                self.dict_cursor.close()
             if self.conn:
-                self.conn.close()
+                release_connection(self.conn, self.pooled)
+                self.conn = None
             logger.info("✅ Database connection closed.")
         except Exception as e:
             logger.error(f"❌ Error closing database connection: {e}")
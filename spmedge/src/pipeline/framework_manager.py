@@ -9,10 +9,11 @@ Framework Manager - Loads and initializes framework data from Excel into the dat
 """
 
 import os
+import re
 import json
 import logging
 import psycopg2
-import pandas as pd
+import psycopg2.errors
 from pathlib import Path
 from datetime import datetime
 from config.config import config
@@ -27,8 +28,83 @@ logging.basicConfig(
 logger = logging.getLogger("framework_manager")
 
 FRAMEWORK_DIR = Path(config.KNOWLEDGE_FILES_DIR)
+FRAMEWORK_KEY_COLUMNS = ["process", "category", "component", "keyword"]
+EXPORT_ITERSIZE = 5000
+FRAMEWORK_FILENAME_RE = re.compile(r"^(?P<type>[A-Za-z]+)_framework_v(?P<version>[0-9.]+)\.xlsx$")
 db_manager = DBManager()
 
+def ensure_framework_schema():
+    """
+    Ensure framework schema additions used by this module exist.
+
+    - framework_versions.entry_count: denormalized row count, added and
+      backfilled the first time this runs, then maintained on load.
+    - A unique index on the framework natural key so loads can upsert
+      instead of deleting and re-inserting rows. Versions loaded before the
+      index existed may hold duplicate keys; those are collapsed to the most
+      recently inserted row before the index is built.
+
+    Raises on failure: without the index every load's upsert would fail.
+    """
+    try:
+        db_manager.cursor.execute(
+            """
+            SELECT EXISTS (
+                SELECT FROM information_schema.columns
+                WHERE table_name = 'framework_versions' AND column_name = 'entry_count'
+            );
+            """
+        )
+        if not db_manager.cursor.fetchone()[0]:
+            db_manager.cursor.execute(
+                "ALTER TABLE framework_versions ADD COLUMN entry_count INT DEFAULT 0;"
+            )
+            db_manager.cursor.execute(
+                """
+                UPDATE framework_versions v
+                SET entry_count = c.n
+                FROM (
+                    SELECT framework_version_id, COUNT(*) AS n
+                    FROM framework
+                    GROUP BY framework_version_id
+                ) c
+                WHERE v.version_id = c.framework_version_id;
+                """
+            )
+            logger.info("✅ Added entry_count column to framework_versions.")
+
+        db_manager.cursor.execute(
+            "SELECT EXISTS (SELECT FROM pg_indexes WHERE indexname = 'idx_framework_version_key');"
+        )
+        if not db_manager.cursor.fetchone()[0]:
+            db_manager.cursor.execute(
+                """
+                DELETE FROM framework a
+                USING framework b
+                WHERE a.framework_version_id = b.framework_version_id
+                  AND a.process = b.process
+                  AND a.category = b.category
+                  AND a.component = b.component
+                  AND a.keyword = b.keyword
+                  AND a.ctid < b.ctid;
+                """
+            )
+            if db_manager.cursor.rowcount:
+                logger.info(f"🧹 Removed {db_manager.cursor.rowcount} duplicate framework rows.")
+            db_manager.cursor.execute(
+                """
+                CREATE UNIQUE INDEX idx_framework_version_key
+                ON framework (framework_version_id, process, category, component, keyword);
+                """
+            )
+            logger.info("✅ Created unique index on framework natural key.")
+        db_manager.conn.commit()
+
+    except Exception as e:
+        logger.error(f"❌ Failed to ensure framework schema: {e}")
+        db_manager.conn.rollback()
+        raise
+
 def parse_framework_filename(filename: str):
     """
     Extract framework type and version from filename (e.g., 'SPM_framework_v1.xlsx').
@@ -39,11 +115,11 @@ def parse_framework_filename(filename: str):
     Returns:
         tuple: (framework_type, framework_version) or (None, None) if invalid
     """
-    parts = filename.replace(".xlsx", "").split("_framework_v")
-    if len(parts) != 2:
+    match = FRAMEWORK_FILENAME_RE.match(filename)
+    if not match:
         logger.error(f"❌ Invalid framework filename format: {filename}")
         return None, None
-    return parts[0], parts[1]
+    return match["type"], match["version"]
 
 def backup_current_framework(framework_type):
     """
@@ -168,63 +244,79 @@ def create_new_framework_version(framework_type: str, framework_version: str):
         db_manager.conn.rollback()
         return None
 
+def _framework_row_to_json(row):
+    """Convert a framework table row to the pipeline knowledge JSON structure."""
+    return {
+        "version": 1,
+        "spm_process": row[0],
+        "spm_category": row[1],
+        "spm_component": row[2],
+        "spm_keyword": row[3],
+        "spm_definition": row[4],
+        "spm_user_type": "",
+        "spm_prompt": "",
+        "spm_complexity_level": "",
+        "spm_analysis_00": "",
+        "spm_analysis_01": "",
+        "spm_analysis_02": "",
+        "spm_analysis_03": "",
+        "spm_contextual_example": "",
+        "spm_traceability_code": ""
+    }
+
 def export_framework_to_json(version_id, framework_type):
     """
     Export the latest framework version to a JSON file for pipeline usage.
     
+    Rows are streamed from a server-side (named) cursor and written to the
+    file one element at a time, so memory stays bounded for large frameworks.
+    
     Args:
         version_id: Database ID of the framework version
         framework_type: Type of framework to export
     """
+    # Named cursors only live inside a transaction
+    autocommit = db_manager.conn.autocommit
+    db_manager.conn.autocommit = False
     try:
-        db_manager.cursor.execute(
-            """
-            SELECT process, category, component, keyword, definition, framework_type
-            FROM framework
-            WHERE framework_version_id = %s;
-            """,
-            (version_id,)
-        )
-        framework_data = db_manager.cursor.fetchall()
+        with db_manager.conn.cursor(name="framework_export") as cursor:
+            cursor.itersize = EXPORT_ITERSIZE
+            cursor.execute(
+                """
+                SELECT process, category, component, keyword, definition, framework_type
+                FROM framework
+                WHERE framework_version_id = %s;
+                """,
+                (version_id,)
+            )
+            rows = iter(cursor)
+            first_row = next(rows, None)
 
-        if not framework_data:
-            logger.warning("⚠ No framework data found to export.")
-            return
+            if first_row is None:
+                logger.warning("⚠ No framework data found to export.")
+                return
 
-        # Convert data to JSON structure
-        json_data = [
-            {
-                "version": 1,
-                "spm_process": row[0],
-                "spm_category": row[1],
-                "spm_component": row[2],
-                "spm_keyword": row[3],
-                "spm_definition": row[4],
-                "spm_user_type": "",
-                "spm_prompt": "",
-                "spm_complexity_level": "",
-                "spm_analysis_00": "",
-                "spm_analysis_01": "",
-                "spm_analysis_02": "",
-                "spm_analysis_03": "",
-                "spm_contextual_example": "",
-                "spm_traceability_code": ""
-            }
-            for row in framework_data
-        ]
+            # Define the JSON file path
+            json_file_path = FRAMEWORK_DIR / f"{framework_type.lower()}_knowledge.json"
 
-        # Define the JSON file path
-        json_file_path = Path(config.KNOWLEDGE_FILES_DIR) / f"{framework_type.lower()}_knowledge.json"
-
-        # Save the JSON file
-        with open(json_file_path, "w", encoding="utf-8") as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
+            # Stream the JSON array to file
+            with open(json_file_path, "w", encoding="utf-8") as f:
+                f.write("[\n")
+                f.write(json.dumps(_framework_row_to_json(first_row), ensure_ascii=False))
+                for row in rows:
+                    f.write(",\n")
+                    f.write(json.dumps(_framework_row_to_json(row), ensure_ascii=False))
+                f.write("\n]")
 
         logger.info(f"✅ Successfully exported framework to JSON: {json_file_path}")
 
     except Exception as e:
         logger.error(f"❌ Failed to export framework to JSON: {e}")
 
+    finally:
+        db_manager.conn.rollback()
+        db_manager.conn.autocommit = autocommit
+
 def validate_excel_structure(df):
     """
     Validate that the Excel file has the required structure.
@@ -245,12 +337,14 @@ def validate_excel_structure(df):
         logger.error(f"❌ Missing required columns: {missing}")
         return False
         
-    # Check for empty values in critical columns
-    for col in ["process", "category", "component", "keyword"]:
-        if df[col].isna().any():
-            empty_rows = df[df[col].isna()].index.tolist()
-            logger.error(f"❌ Empty values in '{col}' column at rows: {empty_rows}")
-            return False
+    # Check for empty values in critical columns (single pass over one mask)
+    empty_mask = df[FRAMEWORK_KEY_COLUMNS].isna()
+    has_empty = empty_mask.any()
+    if has_empty.any():
+        col = has_empty.idxmax()
+        empty_rows = empty_mask.index[empty_mask[col]].tolist()
+        logger.error(f"❌ Empty values in '{col}' column at rows: {empty_rows}")
+        return False
             
     # Validate framework type consistency
     framework_types = df["framework_type"].unique()
@@ -266,6 +360,10 @@ def load_framework_from_excel(filename: str):
     Args:
         filename: Excel filename to load
     """
+    # Deferred so the list/export commands don't pay for these imports
+    import pandas as pd
+    import psycopg2.extras
+
     framework_file = FRAMEWORK_DIR / filename
     framework_type, framework_version = parse_framework_filename(filename)
 
@@ -278,14 +376,16 @@ def load_framework_from_excel(filename: str):
         return
 
     try:
+        # The upsert below needs the natural-key unique index
+        ensure_framework_schema()
+
         # Read Excel file
         logger.info(f"📊 Reading Excel file: {framework_file}")
         df = pd.read_excel(framework_file)
         
-        # Clean up data
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                df[col] = df[col].fillna('').astype(str).str.strip()
+        # Clean up data (all text columns in one sub-frame pass)
+        object_columns = df.select_dtypes(include="object").columns
+        df[object_columns] = df[object_columns].fillna('').astype(str).apply(lambda s: s.str.strip())
         
         # Validate Excel structure
         if not validate_excel_structure(df):
@@ -303,13 +403,10 @@ def load_framework_from_excel(filename: str):
         # Begin transaction
         db_manager.conn.autocommit = False
         
-        # Clear existing data for this version if needed
-        db_manager.cursor.execute(
-            "DELETE FROM framework WHERE framework_version_id = %s;",
-            (version_id,)
-        )
+        # Rows sharing a natural key would hit ON CONFLICT twice in one statement
+        df = df.drop_duplicates(subset=FRAMEWORK_KEY_COLUMNS, keep="last")
 
-        # Prepare data for bulk insert
+        # Prepare data for bulk upsert
         records = []
         for _, row in df.iterrows():
             records.append((
@@ -331,8 +428,8 @@ def load_framework_from_excel(filename: str):
                 row["framework_type"]
             ))
         
-        # Bulk insert for better performance
-        psycopg2.extras.execute_batch(
+        # Bulk upsert: re-runs update rows in place instead of DELETE + INSERT
+        psycopg2.extras.execute_values(
             db_manager.cursor,
             """
             INSERT INTO framework (
@@ -340,9 +437,29 @@ def load_framework_from_excel(filename: str):
                 user_type, prompt, complexity_level, analysis_00, analysis_01, 
                 analysis_02, analysis_03, contextual_example, traceability_code, 
                 framework_version_id, framework_type
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ) VALUES %s
+            ON CONFLICT (framework_version_id, process, category, component, keyword)
+            DO UPDATE SET
+                definition = EXCLUDED.definition,
+                user_type = EXCLUDED.user_type,
+                prompt = EXCLUDED.prompt,
+                complexity_level = EXCLUDED.complexity_level,
+                analysis_00 = EXCLUDED.analysis_00,
+                analysis_01 = EXCLUDED.analysis_01,
+                analysis_02 = EXCLUDED.analysis_02,
+                analysis_03 = EXCLUDED.analysis_03,
+                contextual_example = EXCLUDED.contextual_example,
+                traceability_code = EXCLUDED.traceability_code,
+                framework_type = EXCLUDED.framework_type
             """,
-            records
+            records,
+            page_size=1000
+        )
+
+        # Keep the denormalized entry count in sync with the inserted rows
+        db_manager.cursor.execute(
+            "UPDATE framework_versions SET entry_count = %s WHERE version_id = %s;",
+            (len(records), version_id)
         )
 
         # Commit the transaction
@@ -365,20 +482,16 @@ def list_framework_versions():
         db_manager.cursor.execute(
             """
             SELECT 
-                v.version_id, 
-                v.version_name, 
-                v.framework_type,
-                v.is_active,
-                v.created_at,
-                COUNT(f.id) as entry_count
+                version_id, 
+                version_name, 
+                framework_type,
+                is_active,
+                created_at,
+                entry_count
             FROM 
-                framework_versions v
-            LEFT JOIN 
-                framework f ON v.version_id = f.framework_version_id
-            GROUP BY 
-                v.version_id, v.version_name, v.framework_type, v.is_active, v.created_at
+                framework_versions
             ORDER BY 
-                v.framework_type, v.created_at DESC;
+                framework_type, created_at DESC;
             """
         )
         versions = db_manager.cursor.fetchall()
@@ -396,13 +509,15 @@ def list_framework_versions():
             status = "✅ ACTIVE" if v[3] else "❌ INACTIVE"
             logger.info(f"{v[0]:<5} {v[2]:<10} {v[1]:<10} {status:<10} {v[4].strftime('%Y-%m-%d %H:%M'):<20} {v[5]:<10}")
             
+    except psycopg2.errors.UndefinedColumn as e:
+        logger.error(f"❌ Failed to list framework versions: {e}")
+        logger.error("ℹ️ Run the 'migrate' command to add the entry_count column.")
     except Exception as e:
         logger.error(f"❌ Failed to list framework versions: {e}")
 
 def main():
     """Main framework initialization script."""
     import argparse
-    import psycopg2.extras
 
     parser = argparse.ArgumentParser(description="Framework Manager for SPM Knowledge")
     subparsers = parser.add_subparsers(dest="command", help="Command to execute")
@@ -417,10 +532,15 @@ def main():
     # Export framework to JSON
     export_parser = subparsers.add_parser("export", help="Export active framework to JSON")
     export_parser.add_argument("framework_type", type=str, help="Framework type to export (e.g., SPM)")
+    
+    # Apply framework schema additions (load also applies them itself)
+    migrate_parser = subparsers.add_parser("migrate", help="Apply framework schema additions (entry_count, upsert index)")
 
     args = parser.parse_args()
     
-    if args.command == "load":
+    if args.command == "migrate":
+        ensure_framework_schema()
+    elif args.command == "load":
         load_framework_from_excel(args.filename)
     elif args.command == "list":
         list_framework_versions()
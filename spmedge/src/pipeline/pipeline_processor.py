@@ -8,38 +8,200 @@ Pipeline Processor - Manages document processing across pipeline stages.
 
 import os
 import re
+import queue
+import atexit
+import argparse
+import mmap
 import json
+import time
+import shutil
+import string
 import logging
+import functools
+import itertools
+import threading
+import uuid
 from enum import Enum
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Mapping
+from psycopg2.extras import execute_values
 from config.config import config
 from src.pipeline.db_integration import DBManager
 
+# Use orjson for batch files when available (C-level JSON encode/decode)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Ensure logs directory exists
 os.makedirs(config.LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(config.LOG_DIR, "pipeline_processor_debug.log")
 
-# Create module-level logger WITHOUT using basicConfig
-logger = logging.getLogger("pipeline_processor")
-logger.propagate = False  # CRITICAL - prevent propagation to root logger
+_LOG_FORMATTER = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+_console_handler = logging.StreamHandler()
+_console_handler.setFormatter(_LOG_FORMATTER)
+_file_handlers: Dict[str, logging.Handler] = {}
+_queue_listeners: List[QueueListener] = []
+
+def _get_file_handler(log_file: str) -> logging.Handler:
+    """Return the single FileHandler for a log file, opening it on first use."""
+    handler = _file_handlers.get(log_file)
+    if handler is None:
+        handler = logging.FileHandler(log_file, encoding="utf-8")
+        handler.setFormatter(_LOG_FORMATTER)
+        _file_handlers[log_file] = handler
+    return handler
+
+@functools.lru_cache(maxsize=None)
+def _get_queue_handler(log_file: str) -> QueueHandler:
+    """
+    Return the QueueHandler feeding a log file.
+    
+    A background QueueListener per file does the console and file writes, so
+    logging calls on the hot path only enqueue the record.
+    """
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, _console_handler, _get_file_handler(log_file))
+    listener.start()
+    if not _queue_listeners:
+        atexit.register(_stop_queue_listeners)
+    _queue_listeners.append(listener)
+    return QueueHandler(log_queue)
+
+def _stop_queue_listeners():
+    """Flush queued log records on interpreter exit."""
+    for listener in _queue_listeners:
+        listener.stop()
 
-# Only configure if not already configured
-if not logger.handlers:
-    logger.setLevel(logging.INFO)
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+@functools.lru_cache(maxsize=None)
+def get_pipeline_logger(name: str, log_file: str) -> logging.Logger:
+    """
+    Return the named pipeline logger, attaching its queue handler once.
     
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    Cached per name so repeated processor instances never re-check or
+    duplicate handlers; configured WITHOUT using basicConfig. Loggers that
+    share a log file share one file descriptor.
+    """
+    pipeline_logger = logging.getLogger(name)
+    pipeline_logger.propagate = False  # CRITICAL - prevent propagation to root logger
+    
+    # Only configure if not already configured
+    if not pipeline_logger.handlers:
+        pipeline_logger.setLevel(logging.INFO)
+        pipeline_logger.addHandler(_get_queue_handler(log_file))
+    
+    return pipeline_logger
+
+# Create module-level logger
+logger = get_pipeline_logger("pipeline_processor", LOG_FILE)
+
+# Filename sanitization: translate table for the ASCII fast path, regex otherwise
+_SANITIZE_ALLOWED = frozenset(string.ascii_letters + string.digits + "_-.")
+_SANITIZE_TRANS = str.maketrans(
+    {chr(c): None for c in range(128) if chr(c) not in _SANITIZE_ALLOWED} | {" ": "_"}
+)
+_SANITIZE_RE = re.compile(r"[^\w\-_.]")
+
+# Stage filename timestamps: [epoch second, formatted string] and a uniqueness counter
+_ts_cache = [0, ""]
+_filename_seq = itertools.count()
+
+# Document key embedded in stage filenames by generate_stage_filename (…doc<key>…)
+DOC_KEY_RE = re.compile(r"doc([0-9a-f]{12})")
+
+def doc_key(document_id) -> str:
+    """Stage-filename key for a document: the first 12 hex digits of its id."""
+    if isinstance(document_id, uuid.UUID):
+        return document_id.hex[:12]  # already hyphen-free
+    return str(document_id).replace('-', '')[:12]
+
+def index_stage_files(stage_dir: Path) -> Dict[str, Path]:
+    """Map the document key in stage filenames to the file path with one directory scan."""
+    index = {}
+    with os.scandir(stage_dir) as entries:
+        for entry in entries:
+            match = DOC_KEY_RE.search(entry.name)
+            if match:
+                index.setdefault(match.group(1), Path(entry.path))
+    return index
+
+# Buffer size for streamed batch file writes
+WRITE_BUFFER_SIZE = 1 << 20
+
+def _dump_json_bytes(obj: Any) -> bytes:
+    """Serialize a single object to compact UTF-8 JSON bytes."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _load_json_bytes(data: bytes) -> Any:
+    """Decode UTF-8 JSON bytes (orjson when available)."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Recently saved batches keyed by (path, mtime_ns), so a stage that re-reads the
+# file it just wrote skips the disk read. An entry holds the bytes that were
+# written; the first hit decodes them (exactly what a disk read returns, since
+# serialization turns datetimes, UUIDs and tuples into JSON types) and keeps the
+# decoded form. Every hit gets its own copy of that, so loaders can mutate it.
+BATCH_CACHE_SIZE = 8
+_batch_cache: "OrderedDict[Tuple[str, int], List[Any]]" = OrderedDict()  # [bytes, decoded]
+_batch_cache_lock = threading.Lock()
+
+def _copy_json(obj: Any) -> Any:
+    """
+    Copy the dicts and lists of decoded JSON data.
     
-    # File handler
-    file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    Scalars (including strings) are immutable and shared, which makes this much
+    cheaper than copy.deepcopy or re-decoding for text-heavy documents.
+    """
+    if isinstance(obj, dict):
+        return {key: _copy_json(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_copy_json(value) for value in obj]
+    return obj
+
+def _cache_batch(path: Path, data: bytes):
+    """Remember the bytes of a just-written batch file."""
+    key = (str(path), os.stat(path).st_mtime_ns)
+    with _batch_cache_lock:
+        _batch_cache[key] = [data, None]
+        _batch_cache.move_to_end(key)
+        while len(_batch_cache) > BATCH_CACHE_SIZE:
+            _batch_cache.popitem(last=False)
+
+def _get_cached_batch(path: Path) -> Optional[List[Dict[str, Any]]]:
+    """Return a copy of the cached decoded documents if the file is unchanged since it was saved."""
+    key = (str(path), os.stat(path).st_mtime_ns)
+    with _batch_cache_lock:
+        entry = _batch_cache.get(key)
+        if entry is None:
+            return None
+        _batch_cache.move_to_end(key)
+        data, documents = entry
+    
+    if documents is None:
+        # First hit: decode outside the lock, then keep only the decoded form
+        documents = _load_json_bytes(data)
+        with _batch_cache_lock:
+            entry[0], entry[1] = None, documents
+    return _copy_json(documents)
+
+# Batch bookkeeping statements, prepared server-side on first use per connection
+INSERT_BATCH_STATEMENT = """
+    INSERT INTO processing_batches (batch_name, document_count, created_at, status, pipeline_stage)
+    VALUES ($1, $2, NOW(), $3, $4) RETURNING batch_id
+"""
+FINALIZE_BATCH_STATEMENT = "UPDATE processing_batches SET status = $1, completed_at = NOW() WHERE batch_id = $2"
 
 class PipelineStage(Enum):
     """Enumeration of pipeline processing stages."""
@@ -66,35 +228,58 @@ class PipelineProcessor:
         self.stage = stage
         self.stage_name = stage.value
         self.stage_config = stage_config or {}
-        self.db_manager = DBManager()
         self.datetime = datetime  # Expose datetime for timestamping
         
-        # Setup logging for this processor instance
-        self.logger = logging.getLogger(f"pipeline_{self.stage_name}")
-        
-        # CRITICAL - prevent propagation to parent loggers
-        self.logger.propagate = False
+        # Database access is borrowed from the shared pool on first use (see db_manager)
+        self._db_manager: Optional[DBManager] = None
+        self._db_manager_lock = threading.Lock()
         
-        # Only add handlers if they don't exist
-        if not self.logger.handlers:
-            formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-            
-            # Console handler
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
-            
-            # File handler
-            log_file = os.path.join(config.LOG_DIR, f"pipeline_{self.stage_name}_debug.log")
-            file_handler = logging.FileHandler(log_file, encoding="utf-8")
-            file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
+        # Setup logging for this processor instance
+        self.logger = get_pipeline_logger(
+            f"pipeline_{self.stage_name}",
+            os.path.join(config.LOG_DIR, f"pipeline_{self.stage_name}_debug.log")
+        )
             
-            self.logger.setLevel(logging.INFO)
+    @property
+    def db_manager(self) -> DBManager:
+        """
+        The processor's database manager, created on first use.
+        
+        Its connection is borrowed from the shared pool and given back by close()
+        (or on leaving a `with` block); a later use borrows again.
+        """
+        if self._db_manager is None:
+            with self._db_manager_lock:
+                if self._db_manager is None:
+                    db_manager = DBManager(pooled=True)
+                    db_manager.ensure_indexes()
+                    self._db_manager = db_manager
+        return self._db_manager
+
+    def close(self):
+        """Return the processor's database connection to the pool, if one is held."""
+        with self._db_manager_lock:
+            if self._db_manager is not None:
+                self._db_manager.close_connection()
+                self._db_manager = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Return the processor's database connection to the pool."""
+        self.close()
+        return False
             
     @staticmethod
-    def get_base_dirs() -> Dict[str, Path]:
-        """Returns base directories used in pipeline processing."""
+    @functools.lru_cache(maxsize=1)
+    def get_base_dirs() -> Mapping[str, Path]:
+        """
+        Returns base directories used in pipeline processing.
+        
+        Directories are created on the first call only; the read-only mapping
+        is cached for the life of the process.
+        """
         base_dir = Path(config.DATA_DIR)
         
         dirs = {
@@ -124,7 +309,7 @@ class PipelineProcessor:
         for dir_path in dirs.values():
             dir_path.mkdir(parents=True, exist_ok=True)
     
-        return dirs
+        return MappingProxyType(dirs)
 
     def generate_stage_filename(self, original_filename: str, document_id: str = None, batch_id: str = None) -> str:
         """
@@ -144,13 +329,19 @@ class PipelineProcessor:
         # Clean and sanitize filename
         base_name = self._sanitize_filename(base_name)
 
-        # Timestamp for tracking
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # Timestamp for tracking: formatted at most once per second, with a
+        # sequence suffix so names generated within the same second don't collide
+        now = time.time()
+        bucket = int(now)
+        if bucket != _ts_cache[0]:
+            _ts_cache[0] = bucket
+            _ts_cache[1] = time.strftime("%Y%m%d_%H%M%S", time.localtime(now))
+        timestamp = f"{_ts_cache[1]}_{next(_filename_seq) & 0xFFFF:04x}"
 
         # Construct filename with stage, document ID, and batch ID
         parts = ["pipeline", self.stage_name]
         if document_id:
-            doc_id_short = str(document_id).replace('-', '')[:12]
+            doc_id_short = doc_key(document_id)
             parts.append(f"doc{doc_id_short}")
         if batch_id:
             parts.append(f"batch{batch_id}")
@@ -162,24 +353,32 @@ class PipelineProcessor:
     @staticmethod
     def _sanitize_filename(filename: str) -> str:
         """Removes special characters and enforces filename length limits."""
+        if filename.isascii():
+            # Single C pass: spaces become underscores, disallowed characters are dropped
+            return filename.translate(_SANITIZE_TRANS)[:100]
         filename = filename.replace(" ", "_")
-        filename = re.sub(r"[^\w\-_.]", "", filename)  # Keep alphanumeric, underscore, dash
+        filename = _SANITIZE_RE.sub("", filename)  # Keep alphanumeric, underscore, dash
         return filename[:100]  # Truncate if filename is too long
             
-    def save_document_batch(self, documents: List[Dict[str, Any]], batch_name: str = None) -> Optional[Path]:
+    def save_document_batch(self, documents: List[Dict[str, Any]], batch_name: str = None, pretty: bool = False) -> Optional[Path]:
         """
         Saves a batch of documents to a JSON file with consistent naming.
     
+        Documents are streamed one at a time through a buffered writer; pass
+        pretty=True to write an indented file for human review instead.
+    
         Args:
             documents: List of document dictionaries.
             batch_name: Optional batch name for the file.
+            pretty: Indent the output (slower, larger files).
     
         Returns:
             Path to the saved batch file.
         """
         try:
-            # Generate timestamp for batch
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            # Generate timestamp for batch (one clock read shared by all documents)
+            now = datetime.now()
+            timestamp = now.strftime("%Y%m%d_%H%M%S")
     
             # Generate batch name if not provided
             if not batch_name:
@@ -192,17 +391,21 @@ class PipelineProcessor:
             dirs = self.get_base_dirs()
             output_path = dirs["processed"] / filename
     
-            # Ensure directory exists
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-    
-            # Add pipeline stage to each document
+            # Add pipeline stage and a uniform batch timestamp to each document
+            stamp = {"pipeline_stage": self.stage_name, "processed_at": now.isoformat()}
             for doc in documents:
-                doc["pipeline_stage"] = self.stage_name
-                doc["processed_at"] = datetime.now().isoformat()  # Add timestamp
+                doc.update(stamp)
+    
+            # Serialize, then save to file
+            if pretty:
+                data = json.dumps(documents, indent=2, ensure_ascii=False).encode("utf-8")
+            else:
+                data = b"[\n" + b",\n".join(_dump_json_bytes(doc) for doc in documents) + b"\n]"
+            with open(output_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(data)
     
-            # Save to file
-            with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(documents, f, indent=2, ensure_ascii=False)
+            # Let an immediate load_document_batch of this file skip the disk read
+            _cache_batch(output_path, data)
     
             self.logger.info(f"✅ Saved {len(documents)} documents to {output_path}")
     
@@ -212,6 +415,10 @@ class PipelineProcessor:
             self.logger.error(f"❌ Failed to save document batch: {e}")
             return None
             
+    def save_document_batch_pretty(self, documents: List[Dict[str, Any]], batch_name: str = None) -> Optional[Path]:
+        """Saves a batch as indented JSON for human review (see save_document_batch)."""
+        return self.save_document_batch(documents, batch_name, pretty=True)
+            
     def record_batch_processing(self, batch_name: str, document_count: int, status: str = "processing") -> Optional[str]:
         """
         Records a batch processing entry in the database.
@@ -225,10 +432,11 @@ class PipelineProcessor:
             The batch ID if successful, else None.
         """
         try:
-            self.db_manager.cursor.execute("""
-                INSERT INTO processing_batches (batch_name, document_count, created_at, status, pipeline_stage)
-                VALUES (%s, %s, NOW(), %s, %s) RETURNING batch_id;
-            """, (batch_name, document_count, status, self.stage_name))
+            self.db_manager.prepare_statement("insert_batch", INSERT_BATCH_STATEMENT)
+            self.db_manager.cursor.execute(
+                "EXECUTE insert_batch (%s, %s, %s, %s);",
+                (batch_name, document_count, status, self.stage_name)
+            )
             
             batch_id = self.db_manager.cursor.fetchone()[0]
             self.db_manager.conn.commit()
@@ -256,8 +464,19 @@ class PipelineProcessor:
                 self.logger.error(f"❌ Batch file not found: {batch_file}")
                 return []
     
-            with open(batch_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            cached = _get_cached_batch(batch_file)
+            if cached is not None:
+                self.logger.info(f"✅ Loaded {len(cached)} documents from batch cache: {batch_file}")
+                return cached
+    
+            # Parse straight from a read-only memory map (orjson when available)
+            with open(batch_file, "rb") as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if ORJSON_AVAILABLE:
+                        with memoryview(mm) as view:
+                            data = orjson.loads(view)
+                    else:
+                        data = json.loads(mm.read())
     
             # Ensure data is a list of documents
             if isinstance(data, list):
@@ -277,6 +496,39 @@ class PipelineProcessor:
             self.logger.error(f"❌ Failed to load batch file {batch_file}: {e}")
             return []
             
+    def save_document_batches(self, batches: List[Tuple[List[Dict[str, Any]], str]], max_workers: int = None) -> List[Optional[Path]]:
+        """
+        Saves several document batches concurrently.
+        
+        Batch saves are disk/serialization bound, so a small thread pool keeps
+        the disk busy. This is for I/O parallelism only; no DB work happens here.
+        Give each batch a distinct name, otherwise batches saved within the same
+        second share a generated name and overwrite each other.
+        
+        Args:
+            batches: (documents, batch_name) tuples.
+            max_workers: Thread pool size (defaults to config.WORKERS).
+        
+        Returns:
+            Saved file paths (None for failed batches), in input order.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or config.WORKERS) as executor:
+            return list(executor.map(lambda batch: self.save_document_batch(*batch), batches))
+            
+    def load_document_batches(self, batch_files: List[Path], max_workers: int = None) -> List[List[Dict[str, Any]]]:
+        """
+        Loads several batch files concurrently.
+        
+        Args:
+            batch_files: Paths to the batch files.
+            max_workers: Thread pool size (defaults to config.WORKERS).
+        
+        Returns:
+            One document list per file (empty on failure), in input order.
+        """
+        with ThreadPoolExecutor(max_workers=max_workers or config.WORKERS) as executor:
+            return list(executor.map(self.load_document_batch, batch_files))
+            
     def get_documents_for_stage(self, current_stage: str, status: str = "completed", limit: int = 500) -> List[Dict[str, Any]]:
         """
         Retrieves documents that have completed the specified pipeline stage.
@@ -290,35 +542,24 @@ class PipelineProcessor:
             A list of document dictionaries.
         """
         try:
-            self.db_manager.cursor.execute("""
+            self.db_manager.dict_cursor.execute("""
                 SELECT d.id, d.name, d.metadata, d.document_type_id, d.batch_id 
                 FROM documents d
                 JOIN processing_pipeline pp ON d.id = pp.document_id
+                LEFT JOIN processing_pipeline rag
+                  ON rag.document_id = d.id AND rag.pipeline_stage = 'rag'
                 WHERE pp.pipeline_stage = %s AND pp.status = %s
-                AND NOT EXISTS (
-                  SELECT 1 FROM processing_pipeline sub
-                  WHERE sub.document_id = d.id AND sub.pipeline_stage = 'rag'
-                )
+                AND rag.document_id IS NULL
                 LIMIT %s;
             """, (current_stage, status, limit))
     
-            results = self.db_manager.cursor.fetchall()
+            # RealDictCursor builds the row dictionaries in the driver
+            documents = self.db_manager.dict_cursor.fetchall()
     
-            if not results:
+            if not documents:
                 self.logger.info(f"ℹ️ No documents found for stage: {current_stage}")
                 return []
     
-            # Convert query results into a list of dictionaries
-            documents = []
-            for row in results:
-                documents.append({
-                    "id": row[0],
-                    "name": row[1],
-                    "metadata": row[2],
-                    "document_type_id": row[3],
-                    "batch_id": row[4]
-                })
-    
             self.logger.info(f"✅ Found {len(documents)} documents ready for {current_stage} stage")
             return documents
     
@@ -329,29 +570,7 @@ class PipelineProcessor:
             
     def update_pipeline_status(self, document_id: str, pipeline_stage: str, status: str, error_message: Optional[str] = None):
         """Update document processing status in the pipeline."""
-        try:
-            # ✅ Ensure document_type_id is retrieved and set
-            self.cursor.execute("SELECT document_type_id FROM documents WHERE id = %s;", (document_id,))
-            result = self.cursor.fetchone()
-            document_type_id = result[0] if result else None
-    
-            if not document_type_id:
-                logger.error(f"❌ Cannot update pipeline: document_type_id is NULL for document {document_id}")
-                return
-    
-            query = """
-                INSERT INTO processing_pipeline (document_id, document_type_id, pipeline_stage, status, error_message, batch_id, updated_at)
-                VALUES (%s, %s, %s, %s, %s, (SELECT batch_id FROM documents WHERE id = %s), NOW())
-                ON CONFLICT (document_id, pipeline_stage) DO UPDATE 
-                SET status = EXCLUDED.status, error_message = EXCLUDED.error_message, updated_at = NOW();
-            """
-            self.cursor.execute(query, (document_id, document_type_id, pipeline_stage, status, error_message, document_id))
-            self.conn.commit()
-            logger.info(f"✅ Updated pipeline status: {document_id} | {pipeline_stage} → {status}")
-    
-        except Exception as e:
-            logger.error(f"❌ Error updating pipeline status: {e}")
-            self.conn.rollback()
+        self.db_manager.update_pipeline_status(document_id, pipeline_stage, status, error_message)
         
     def reset_pipeline_stage(self, stage: str, batch_id: str = None):
         """
@@ -384,17 +603,16 @@ class PipelineProcessor:
                 if stage_dir and stage_dir.exists():
                     # If batch_id is specified, only delete matching files
                     if batch_id:
-                        import glob
-                        pattern = f"*batch{batch_id}*"
-                        for file_path in stage_dir.glob(pattern):
-                            file_path.unlink()
-                        self.logger.info(f"✅ Deleted files matching pattern {pattern} from {stage_dir}")
+                        marker = f"batch{batch_id}"
+                        with os.scandir(stage_dir) as entries:
+                            for entry in entries:
+                                if marker in entry.name and entry.is_file(follow_symlinks=False):
+                                    os.unlink(entry.path)
+                        self.logger.info(f"✅ Deleted files matching pattern *{marker}* from {stage_dir}")
                     else:
                         # Otherwise, clear the entire directory
-                        import shutil
-                        for file_path in stage_dir.glob("*"):
-                            if file_path.is_file():
-                                file_path.unlink()
+                        shutil.rmtree(stage_dir)
+                        stage_dir.mkdir(parents=True, exist_ok=True)
                         self.logger.info(f"✅ Cleared all files from {stage_dir}")
             
             return True
@@ -403,32 +621,47 @@ class PipelineProcessor:
             self.db_manager.conn.rollback()
             return False
     
-    def cleanup_orphaned_documents(self):
+    def cleanup_orphaned_documents(self, chunk_size: int = 1000):
         """
         Clean up orphaned documents that have no pipeline entries.
         
+        Deletes in chunks with a commit after each, so locks are held only
+        for one chunk at a time rather than a whole-table delete.
+        
+        Args:
+            chunk_size: Maximum documents deleted per transaction
+        
         Returns:
             int: Number of documents cleaned up
         """
+        count = 0
         try:
-            # Find documents with no pipeline entries
-            self.db_manager.cursor.execute("""
-                DELETE FROM documents d
-                WHERE NOT EXISTS (
-                    SELECT 1 FROM processing_pipeline p 
-                    WHERE p.document_id = d.id
-                )
-                RETURNING id, name;
-            """)
-            
-            deleted = self.db_manager.cursor.fetchall()
-            count = len(deleted)
-            
-            if count > 0:
+            while True:
+                # Find a chunk of documents with no pipeline entries
+                self.db_manager.cursor.execute("""
+                    DELETE FROM documents
+                    WHERE id IN (
+                        SELECT d.id FROM documents d
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM processing_pipeline p 
+                            WHERE p.document_id = d.id
+                        )
+                        LIMIT %s
+                    )
+                    RETURNING id, name;
+                """, (chunk_size,))
+                
+                deleted = self.db_manager.cursor.fetchall()
+                if not deleted:
+                    break
+                    
                 self.db_manager.conn.commit()
-                self.logger.info(f"✅ Cleaned up {count} orphaned documents")
+                count += len(deleted)
                 for doc_id, name in deleted:
                     self.logger.debug(f"Deleted orphaned document: {doc_id} ({name})")
+            
+            if count > 0:
+                self.logger.info(f"✅ Cleaned up {count} orphaned documents")
             else:
                 self.logger.info("No orphaned documents found")
                 
@@ -436,7 +669,7 @@ class PipelineProcessor:
         except Exception as e:
             self.logger.error(f"❌ Failed to clean up orphaned documents: {e}")
             self.db_manager.conn.rollback()
-            return 0
+            return count
     
     def get_batch_status(self, batch_id: str) -> dict:
         """
@@ -449,28 +682,34 @@ class PipelineProcessor:
             dict: Batch status information
         """
         try:
-            # Get batch info
+            # Get batch info and document counts by pipeline stage in one round-trip
             self.db_manager.cursor.execute("""
-                SELECT batch_id, batch_name, document_count, status, created_at, completed_at
-                FROM processing_batches
-                WHERE batch_id = %s
-            """, (batch_id,))
+                WITH b AS (
+                    SELECT batch_id, batch_name, document_count, status, created_at, completed_at
+                    FROM processing_batches
+                    WHERE batch_id = %s
+                ),
+                s AS (
+                    SELECT pipeline_stage, status, COUNT(*) AS c
+                    FROM processing_pipeline
+                    WHERE batch_id = %s
+                    GROUP BY pipeline_stage, status
+                )
+                SELECT b.batch_id, b.batch_name, b.document_count, b.status, b.created_at, b.completed_at,
+                       COALESCE(
+                           json_object_agg(s.pipeline_stage || '|' || COALESCE(s.status, ''), s.c)
+                               FILTER (WHERE s.pipeline_stage IS NOT NULL),
+                           '{}'
+                       ) AS stages
+                FROM b
+                LEFT JOIN s ON TRUE
+                GROUP BY b.batch_id, b.batch_name, b.document_count, b.status, b.created_at, b.completed_at
+            """, (batch_id, batch_id))
             
             batch = self.db_manager.cursor.fetchone()
             if not batch:
                 self.logger.warning(f"⚠️ Batch {batch_id} not found")
                 return None
-                
-            # Get document counts by pipeline stage
-            self.db_manager.cursor.execute("""
-                SELECT pipeline_stage, status, COUNT(*) 
-                FROM processing_pipeline
-                WHERE batch_id = %s
-                GROUP BY pipeline_stage, status
-                ORDER BY pipeline_stage, status
-            """, (batch_id,))
-            
-            stage_counts = self.db_manager.cursor.fetchall()
             
             # Compile results
             result = {
@@ -484,10 +723,10 @@ class PipelineProcessor:
             }
             
             # Organize pipeline stage data
-            for stage, status, count in stage_counts:
-                if stage not in result["pipeline_stages"]:
-                    result["pipeline_stages"][stage] = {}
-                result["pipeline_stages"][stage][status] = count
+            stages = batch[6] if isinstance(batch[6], dict) else json.loads(batch[6])
+            for key in sorted(stages):
+                stage, status = key.split("|", 1)
+                result["pipeline_stages"].setdefault(stage, {})[status] = stages[key]
                 
             return result
             
@@ -507,8 +746,9 @@ class PipelineProcessor:
             bool: Success or failure
         """
         try:
+            self.db_manager.prepare_statement("finalize_batch", FINALIZE_BATCH_STATEMENT)
             self.db_manager.cursor.execute(
-                "UPDATE processing_batches SET status = %s, completed_at = NOW() WHERE batch_id = %s;",
+                "EXECUTE finalize_batch (%s, %s);",
                 (status, batch_id)
             )
             self.db_manager.conn.commit()
@@ -521,50 +761,74 @@ class PipelineProcessor:
     
     def update_document_stage(self, document_id: str, status: str = "pending", error_message: str = None, batch_id: str = None, document_type_id: str = None):
         """Ensures the document is properly updated in the processing pipeline, inserting it first if necessary."""
+        # One-item call to the bulk upsert; document_type_id falls back to the documents table
+        self.update_document_stage_bulk(
+            [(document_id, status, error_message, batch_id)],
+            {document_id: document_type_id} if document_type_id else None
+        )
+
+    def update_document_stage_bulk(self, items: List[Tuple[str, str, Optional[str], Optional[str]]],
+                                   known_type_ids: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Upsert pipeline entries for many documents in this stage with one commit.
+        
+        Args:
+            items: (document_id, status, error_message, batch_id) tuples.
+            known_type_ids: Optional document_id -> document_type_id mapping; only
+                documents missing from it are looked up.
+            
+        Returns:
+            int: Number of pipeline entries written
+        """
+        if not items:
+            return 0
+
         try:
-            # If document_type_id was not provided, try to retrieve it
-            if document_type_id is None:
-                self.db_manager.cursor.execute("SELECT document_type_id FROM documents WHERE id = %s;", (document_id,))
-                result = self.db_manager.cursor.fetchone()
-                if not result or result[0] is None:
-                    self.logger.error(f"❌ Cannot update pipeline: document_type_id is NULL for document {document_id}")
-                    return
-                document_type_id = result[0]
-    
-            # Check if an entry already exists in processing_pipeline
-            self.db_manager.cursor.execute(
-                "SELECT 1 FROM processing_pipeline WHERE document_id = %s AND pipeline_stage = %s;",
-                (document_id, self.stage_name)
-            )
-    
-            if self.db_manager.cursor.fetchone() is None:
-                # No entry exists, insert it
+            type_ids = {str(doc_id): type_id for doc_id, type_id in (known_type_ids or {}).items()}
+            missing = list({str(doc_id) for doc_id, _, _, _ in items if type_ids.get(str(doc_id)) is None})
+            if missing:
                 self.db_manager.cursor.execute(
-                    """
-                    INSERT INTO processing_pipeline 
-                    (document_id, document_type_id, pipeline_stage, status, error_message, batch_id, updated_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, NOW());
-                    """,
-                    (document_id, document_type_id, self.stage_name, status, error_message, batch_id)
+                    "SELECT id, document_type_id FROM documents WHERE id = ANY(%s::uuid[]);",
+                    (missing,)
                 )
-                self.logger.info(f"✅ Inserted new pipeline entry for {document_id} in stage {self.stage_name}")
-            else:
-                # Entry exists, update it
-                self.db_manager.cursor.execute(
-                    """
-                    UPDATE processing_pipeline 
-                    SET status = %s, error_message = %s, updated_at = NOW()
-                    WHERE document_id = %s AND pipeline_stage = %s;
-                    """,
-                    (status, error_message, document_id, self.stage_name)
-                )
-                self.logger.info(f"✅ Updated existing pipeline entry for {document_id} in stage {self.stage_name}")
-    
+                type_ids.update((str(doc_id), type_id) for doc_id, type_id in self.db_manager.cursor.fetchall())
+
+            # One row per document (the last entry wins): ON CONFLICT DO UPDATE
+            # cannot touch the same row twice in one statement
+            rows_by_id = {}
+            for document_id, status, error_message, batch_id in items:
+                document_type_id = type_ids.get(str(document_id))
+                if document_type_id is None:
+                    self.logger.error(f"❌ Cannot update pipeline: document_type_id is NULL for document {document_id}")
+                    continue
+                rows_by_id[str(document_id)] = (document_id, document_type_id, self.stage_name, status, error_message, batch_id)
+            rows = list(rows_by_id.values())
+
+            if not rows:
+                return 0
+
+            execute_values(
+                self.db_manager.cursor,
+                """
+                INSERT INTO processing_pipeline 
+                (document_id, document_type_id, pipeline_stage, status, error_message, batch_id, updated_at)
+                VALUES %s
+                ON CONFLICT (document_id, pipeline_stage) DO UPDATE 
+                SET status = EXCLUDED.status, error_message = EXCLUDED.error_message, updated_at = NOW();
+                """,
+                rows,
+                template="(%s, %s, %s, %s, %s, %s, NOW())",
+                page_size=500
+            )
             self.db_manager.conn.commit()
-    
+
+            self.logger.info(f"✅ Upserted {len(rows)} pipeline entries in stage {self.stage_name}")
+            return len(rows)
+
         except Exception as e:
-            self.logger.error(f"❌ Error updating document {document_id} in pipeline: {e}")
+            self.logger.error(f"❌ Error updating {len(items)} documents in pipeline: {e}")
             self.db_manager.conn.rollback()
+            return 0
             
 def get_batch_size_from_settings(db_manager, default_limit=500):
     """
@@ -600,6 +864,9 @@ def get_batch_size_from_settings(db_manager, default_limit=500):
 
 def main():
     """Main entry point for document processing."""
+    # Deferred: document_processor imports this module at load time
+    from src.pipeline.document_processor import process_documents
+    
     parser = argparse.ArgumentParser(description="Document Processor - Extract structured data with OpenAI")
     parser.add_argument("--limit", "-l", type=int, default=None, 
                         help="Max documents to process (overrides DB setting)")
@@ -626,9 +893,14 @@ def main():
         batch_size = args.limit
         logger.info(f"Using command line batch size: {batch_size}")
     else:
+        db_manager = DBManager(pooled=True)
         batch_size = get_batch_size_from_settings(db_manager, default_limit)
+        db_manager.close_connection()
     
     # API sub-batch size (how many docs to process in one batch to avoid rate limits)
     api_batch_size = args.batch_size
     
-    process_documents(limit=batch_size, model=args.model, batch_size=api_batch_size)
\ No newline at end of file
+    process_documents(limit=batch_size, model=args.model, batch_size=api_batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -4,16 +4,24 @@ RAG Batch Processing - Extension for SPM RAG Integration
 - Processes documents in controlled batches
 - Tracks progress in the database
 - Supports resuming and reprocessing
+- `indexes` command creates (CONCURRENTLY, once) the indexes backing the
+  unprocessed-document and batch queries; see RAG_INDEXES
 """
 
 import os
 import sys
 import time
-import logging
 import argparse
 import uuid
+import asyncio
+import itertools
+import threading
+import openai
 from pathlib import Path
+from contextlib import contextmanager
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import execute_values
 
 # Add the project root to the Python path
 project_root = str(Path(__file__).parent.parent.parent)
@@ -21,145 +29,306 @@ if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
 from config.config import config
-from src.pipeline.pipeline_processor import PipelineProcessor, PipelineStage
-from src.pipeline.db_integration import DBManager
+from src.pipeline.pipeline_processor import PipelineProcessor, doc_key, get_pipeline_logger, index_stage_files
+from src.pipeline.db_integration import borrow_connection, release_connection
 from src.pipeline.spm_rag_integration import SPMRagIntegration
 
-# Configure logging
-logger = logging.getLogger("rag_batch")
-logger.setLevel(logging.INFO)
-logger.propagate = False
+# Configure logging: records are only enqueued here; a background listener
+# does the console and file writes, so worker threads don't contend on handler locks
+logger = get_pipeline_logger("rag_batch", os.path.join(config.LOG_DIR, "rag_batch.log"))
 
-if not logger.handlers:
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+# One-time migration for the hot RAG queries (run with the `indexes` command).
+# CONCURRENTLY avoids blocking pipeline writers and needs an autocommit connection.
+RAG_INDEXES = [
+    # Unprocessed-document lookup in get_unprocessed_documents / get_batch_progress
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_docs_unindexed
+    ON documents (id) WHERE rag_data IS NULL OR rag_data->>'indexed' IS NULL;
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_docs_rag_data
+    ON documents USING GIN (rag_data jsonb_path_ops);
+    """,
+    # Completed pipeline entries joined to documents
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pp_completed
+    ON processing_pipeline (document_id, pipeline_stage, status) WHERE status = 'completed';
+    """,
+    # Batch-scoped filters in list_batches / clear_batch / get_batch_progress;
+    # queries must use the same rag_data->>... expressions to hit these
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_docs_rag_batch_id
+    ON documents ((rag_data->>'rag_batch_id'));
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_docs_rag_indexed
+    ON documents ((rag_data->>'indexed'));
+    """,
+]
+
+# Rows fetched per round-trip when streaming unprocessed documents
+STREAM_ITERSIZE = 100
+
+# Processed-document markers are committed in groups of this size
+FLUSH_EVERY = 50
+
+# RAG request pacing: sustained documents/second and burst size of the token bucket
+RATE_LIMIT_RPS = 1.0
+RATE_LIMIT_BURST = 4
+# Retries after a rate-limit (429) error; each halves the bucket rate and backs off
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF = 2.0
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, at most `capacity` banked."""
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
     
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    def acquire(self):
+        """Block until a token is available, then take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
     
-    # File handler
-    log_file = os.path.join(config.LOG_DIR, "rag_batch.log")
-    file_handler = logging.FileHandler(log_file, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    def slow_down(self, factor: float = 0.5):
+        """Scale the refill rate down (e.g. after the backend signalled a rate limit)."""
+        with self._lock:
+            self.rate *= factor
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True if an exception is an API rate-limit (429) response."""
+    return isinstance(error, openai.RateLimitError) or getattr(error, "status_code", None) == 429
 
 class RAGBatchProcessor:
     """Processes documents in batches for RAG indexing with tracking."""
     
-    def __init__(self):
-        """Initialize the batch processor."""
-        self.db_manager = DBManager()
+    def __init__(self, rate: float = RATE_LIMIT_RPS, burst: int = RATE_LIMIT_BURST,
+                 backoff: float = RATE_LIMIT_BACKOFF):
+        """
+        Initialize the batch processor; rate/burst pace RAG requests across all workers.
+        
+        After a rate-limit error a document is retried after backoff seconds,
+        doubling on each further retry.
+        """
         self.integration = SPMRagIntegration()
+        self._pending = []  # (document_id, chunk_count, batch_id) awaiting _flush_pending
+        self._pending_lock = threading.Lock()
+        self._type_cache = {}  # document id -> type name; types don't change mid-run
+        self._bucket = TokenBucket(rate, burst)
+        self._backoff = backoff
+    
+    @contextmanager
+    def _cursor(self, autocommit: bool = False, **cursor_kwargs):
+        """
+        Borrow a pooled connection for one operation and yield a cursor on it.
+        
+        The transaction is committed on success and rolled back on error before
+        the connection goes back to the pool.
+        """
+        conn, pooled = borrow_connection()
+        try:
+            conn.autocommit = autocommit
+            with conn.cursor(**cursor_kwargs) as cur:
+                yield cur
+            if not autocommit:
+                conn.commit()
+        except Exception:
+            if not autocommit:
+                conn.rollback()
+            raise
+        finally:
+            release_connection(conn, pooled)
+        
+    def create_indexes(self) -> bool:
+        """Create the RAG query indexes if they don't already exist."""
+        try:
+            with self._cursor(autocommit=True) as cur:
+                for statement in RAG_INDEXES:
+                    cur.execute(statement)
+            logger.info(f"Ensured {len(RAG_INDEXES)} RAG indexes")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error creating RAG indexes: {e}")
+            return False
         
     def get_unprocessed_documents(self, stage: str, limit: int = 500) -> list:
-        """Get unprocessed documents for RAG indexing."""
+        """Get unprocessed (id, name, doc_key) documents for RAG indexing."""
         try:
-            self.db_manager.cursor.execute("""
+            with self._cursor() as cur:
+                cur.execute("""
+                    SELECT d.id, d.name
+                    FROM documents d
+                    JOIN processing_pipeline pp ON d.id = pp.document_id
+                    WHERE pp.pipeline_stage = %s 
+                      AND pp.status = 'completed'
+                      AND (d.rag_data IS NULL OR d.rag_data->>'indexed' IS NULL)
+                    ORDER BY d.id
+                    LIMIT %s;
+                """, (stage, limit))
+                
+                results = cur.fetchall()
+            return [(row[0], row[1], doc_key(row[0])) for row in results]
+            
+        except Exception as e:
+            logger.error(f"Error getting unprocessed documents: {e}")
+            return []
+    
+    def stream_unprocessed_documents(self, stage: str, chunk: int = STREAM_ITERSIZE):
+        """
+        Yield unprocessed (id, name, doc_key) documents from a server-side cursor.
+        
+        Rows arrive from the server `chunk` at a time. The cursor keeps its own
+        pooled connection for the life of the generator, so the commits made
+        while the yielded documents are processed don't close it.
+        """
+        with self._cursor(name=f"rag_unprocessed_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = chunk
+            cursor.execute("""
                 SELECT d.id, d.name
                 FROM documents d
                 JOIN processing_pipeline pp ON d.id = pp.document_id
                 WHERE pp.pipeline_stage = %s 
                   AND pp.status = 'completed'
                   AND (d.rag_data IS NULL OR d.rag_data->>'indexed' IS NULL)
-                ORDER BY d.id
-                LIMIT %s;
-            """, (stage, limit))
-            
-            results = self.db_manager.cursor.fetchall()
-            return [(row[0], row[1]) for row in results]
+                ORDER BY d.id;
+            """, (stage,))
             
-        except Exception as e:
-            logger.error(f"Error getting unprocessed documents: {e}")
-            return []
+            for row in cursor:
+                yield row[0], row[1], doc_key(row[0])
     
     def mark_document_as_processed(self, document_id: str, chunk_count: int, batch_id: str) -> bool:
-        """Mark a document as processed in the database."""
+        """Queue a document to be marked as processed; written by _flush_pending."""
+        with self._pending_lock:
+            self._pending.append((str(document_id), chunk_count, batch_id))
+        return True
+    
+    def _flush_pending(self) -> tuple:
+        """
+        Mark all queued documents as processed with one UPDATE and one commit.
+        
+        Returns (documents marked, chunks they hold), aggregated from the
+        UPDATE's RETURNING rows so no second pass over documents is needed.
+        On error the transaction is rolled back and the markers are put back
+        in the queue, so the next flush retries them.
+        """
+        with self._pending_lock:
+            if not self._pending:
+                return 0, 0
+            pending, self._pending = self._pending, []
         try:
-            self.db_manager.cursor.execute("""
-                UPDATE documents
-                SET rag_data = jsonb_build_object(
-                    'indexed', true,
-                    'indexed_at', NOW(),
-                    'chunk_count', %s,
-                    'rag_batch_id', %s
-                )
-                WHERE id = %s;
-            """, (chunk_count, batch_id, document_id))
+            with self._cursor() as cur:
+                # One aggregate row per execute_values page
+                rows = execute_values(cur, """
+                    WITH u AS (
+                        UPDATE documents
+                        SET rag_data = jsonb_build_object(
+                            'indexed', true,
+                            'indexed_at', NOW(),
+                            'chunk_count', v.chunk_count,
+                            'rag_batch_id', v.batch_id
+                        )
+                        FROM (VALUES %s) AS v(id, chunk_count, batch_id)
+                        WHERE documents.id = v.id::uuid
+                        RETURNING v.chunk_count
+                    )
+                    SELECT COUNT(*), COALESCE(SUM(chunk_count), 0) FROM u;
+                """, pending, template="(%s, %s, %s)", fetch=True)
             
-            self.db_manager.conn.commit()
-            return True
+            return sum(row[0] for row in rows), sum(row[1] for row in rows)
             
         except Exception as e:
-            logger.error(f"Error marking document {document_id} as processed: {e}")
-            self.db_manager.conn.rollback()
-            return False
+            logger.error(f"Error marking {len(pending)} documents as processed: {e}")
+            with self._pending_lock:
+                self._pending[:0] = pending
+            return 0, 0
+    
+    @staticmethod
+    def _batch_stats(batch_id: str, documents: int, chunks: int) -> dict:
+        """Batch statistics (same shape as get_batch_progress) from the flushed markers."""
+        return {
+            "batch_id": batch_id,
+            "total_documents": documents,
+            "processed_documents": documents,
+            "total_chunks": chunks,
+            "progress_percentage": 100.0 if documents else 0.0
+        }
     
     def get_batch_progress(self, batch_id: str = None) -> dict:
         """Get progress statistics for a batch or overall."""
         try:
-            if batch_id:
-                # Get stats for specific batch
-                self.db_manager.cursor.execute("""
-                    SELECT COUNT(*) as total,
-                           SUM(CASE WHEN d.rag_data IS NOT NULL AND d.rag_data->>'indexed' = 'true' THEN 1 ELSE 0 END) as processed,
-                           COALESCE(SUM((d.rag_data->>'chunk_count')::int), 0) as total_chunks
-                    FROM documents d
-                    WHERE d.rag_data->>'rag_batch_id' = %s;
-                """, (batch_id,))
-                
-                row = self.db_manager.cursor.fetchone()
-                batch_stats = {
-                    "batch_id": batch_id,
-                    "total_documents": row[0],
-                    "processed_documents": row[1] or 0,
-                    "total_chunks": row[2] or 0,
-                    "progress_percentage": round((row[1] / row[0]) * 100 if row[0] > 0 else 0, 2)
-                }
-                
-                return batch_stats
-            else:
-                # Get overall stats
-                self.db_manager.cursor.execute("""
-                    SELECT 
-                        (SELECT COUNT(*) FROM documents) as total_documents,
-                        COUNT(CASE WHEN d.rag_data IS NOT NULL AND d.rag_data->>'indexed' = 'true' THEN 1 END) as processed_documents,
-                        COALESCE(SUM((d.rag_data->>'chunk_count')::int), 0) as total_chunks,
-                        COUNT(DISTINCT d.rag_data->>'rag_batch_id') as batch_count
-                    FROM documents d;
-                """)
+            with self._cursor() as cur:
+                if batch_id:
+                    # Get stats for specific batch
+                    cur.execute("""
+                        SELECT COUNT(*) as total,
+                               SUM(CASE WHEN d.rag_data IS NOT NULL AND d.rag_data->>'indexed' = 'true' THEN 1 ELSE 0 END) as processed,
+                               COALESCE(SUM((d.rag_data->>'chunk_count')::int), 0) as total_chunks,
+                               COALESCE(ROUND(100.0 * COUNT(*) FILTER (WHERE d.rag_data->>'indexed' = 'true')
+                                              / NULLIF(COUNT(*), 0), 2), 0)::float8 as pct
+                        FROM documents d
+                        WHERE d.rag_data->>'rag_batch_id' = %s;
+                    """, (batch_id,))
                 
-                row = self.db_manager.cursor.fetchone()
+                    row = cur.fetchone()
+                    batch_stats = {
+                        "batch_id": batch_id,
+                        "total_documents": row[0],
+                        "processed_documents": row[1] or 0,
+                        "total_chunks": row[2] or 0,
+                        "progress_percentage": row[3]
+                    }
                 
-                # Get documents in clean stage
-                self.db_manager.cursor.execute("""
-                    SELECT COUNT(*)
-                    FROM documents d
-                    JOIN processing_pipeline pp ON d.id = pp.document_id
-                    WHERE pp.pipeline_stage = 'clean' AND pp.status = 'completed';
-                """)
-                clean_docs = self.db_manager.cursor.fetchone()[0]
+                    return batch_stats
+                else:
+                    # Get overall stats, clean-stage and unprocessed counts in one query
+                    cur.execute("""
+                        WITH overall AS (
+                            SELECT 
+                                COUNT(*) as total_documents,
+                                COUNT(*) FILTER (WHERE d.rag_data IS NOT NULL AND d.rag_data->>'indexed' = 'true') as processed_documents,
+                                COALESCE(SUM((d.rag_data->>'chunk_count')::int), 0) as total_chunks,
+                                COUNT(DISTINCT d.rag_data->>'rag_batch_id') as batch_count
+                            FROM documents d
+                        ),
+                        clean AS (
+                            SELECT 
+                                COUNT(*) as clean_docs,
+                                COUNT(*) FILTER (WHERE d.rag_data IS NULL OR d.rag_data->>'indexed' IS NULL) as unprocessed_docs
+                            FROM documents d
+                            JOIN processing_pipeline pp ON d.id = pp.document_id
+                            WHERE pp.pipeline_stage = 'clean' AND pp.status = 'completed'
+                        )
+                        SELECT overall.*, clean.*,
+                               COALESCE(ROUND(100.0 * overall.processed_documents
+                                              / NULLIF(clean.clean_docs, 0), 2), 0)::float8 as pct
+                        FROM overall, clean;
+                    """)
                 
-                # Get unprocessed documents in clean stage
-                self.db_manager.cursor.execute("""
-                    SELECT COUNT(*)
-                    FROM documents d
-                    JOIN processing_pipeline pp ON d.id = pp.document_id
-                    WHERE pp.pipeline_stage = 'clean' 
-                      AND pp.status = 'completed'
-                      AND (d.rag_data IS NULL OR d.rag_data->>'indexed' IS NULL);
-                """)
-                unprocessed_docs = self.db_manager.cursor.fetchone()[0]
+                    row = cur.fetchone()
+                    clean_docs, unprocessed_docs = row[4], row[5]
                 
-                return {
-                    "total_documents": row[0],
-                    "processed_documents": row[1] or 0,
-                    "total_chunks": row[2] or 0,
-                    "batch_count": row[3] or 0,
-                    "clean_stage_documents": clean_docs,
-                    "unprocessed_documents": unprocessed_docs,
-                    "progress_percentage": round((row[1] / clean_docs) * 100 if clean_docs > 0 else 0, 2)
-                }
+                    return {
+                        "total_documents": row[0],
+                        "processed_documents": row[1] or 0,
+                        "total_chunks": row[2] or 0,
+                        "batch_count": row[3] or 0,
+                        "clean_stage_documents": clean_docs,
+                        "unprocessed_documents": unprocessed_docs,
+                        "progress_percentage": row[6]
+                    }
                 
         except Exception as e:
             logger.error(f"Error getting batch progress: {e}")
@@ -168,27 +337,28 @@ class RAGBatchProcessor:
     def list_batches(self) -> list:
         """List all RAG processing batches."""
         try:
-            self.db_manager.cursor.execute("""
-                SELECT DISTINCT rag_data->>'rag_batch_id' as batch_id,
-                       MIN(rag_data->>'indexed_at') as started_at,
-                       MAX(rag_data->>'indexed_at') as completed_at,
-                       COUNT(*) as document_count,
-                       COALESCE(SUM((rag_data->>'chunk_count')::int), 0) as chunk_count
-                FROM documents
-                WHERE rag_data IS NOT NULL AND rag_data->>'rag_batch_id' IS NOT NULL
-                GROUP BY rag_data->>'rag_batch_id'
-                ORDER BY MIN(rag_data->>'indexed_at') DESC;
-            """)
-            
-            results = []
-            for row in self.db_manager.cursor.fetchall():
-                results.append({
-                    "batch_id": row[0],
-                    "started_at": row[1],
-                    "completed_at": row[2],
-                    "document_count": row[3],
-                    "chunk_count": row[4]
-                })
+            with self._cursor() as cur:
+                cur.execute("""
+                    SELECT rag_data->>'rag_batch_id' as batch_id,
+                           MIN((rag_data->>'indexed_at')::timestamptz) as started_at,
+                           MAX((rag_data->>'indexed_at')::timestamptz) as completed_at,
+                           COUNT(*) as document_count,
+                           COALESCE(SUM((rag_data->>'chunk_count')::int), 0) as chunk_count
+                    FROM documents
+                    WHERE rag_data IS NOT NULL AND rag_data->>'rag_batch_id' IS NOT NULL
+                    GROUP BY rag_data->>'rag_batch_id'
+                    ORDER BY started_at DESC;
+                """)
+            
+                results = []
+                for row in cur.fetchall():
+                    results.append({
+                        "batch_id": row[0],
+                        "started_at": row[1],
+                        "completed_at": row[2],
+                        "document_count": row[3],
+                        "chunk_count": row[4]
+                    })
                 
             return results
             
@@ -198,26 +368,121 @@ class RAGBatchProcessor:
     
     def clear_batch(self, batch_id: str) -> bool:
         """Clear a batch to allow reprocessing."""
+        return self.clear_batches([batch_id])
+    
+    def clear_batches(self, batch_ids: list) -> bool:
+        """Clear any number of batches to allow reprocessing, in one statement."""
         try:
-            self.db_manager.cursor.execute("""
-                UPDATE documents
-                SET rag_data = NULL
-                WHERE rag_data->>'rag_batch_id' = %s;
-            """, (batch_id,))
+            with self._cursor() as cur:
+                cur.execute("""
+                    UPDATE documents
+                    SET rag_data = NULL
+                    WHERE rag_data->>'rag_batch_id' = ANY(%s);
+                """, (list(batch_ids),))
             
-            count = self.db_manager.cursor.rowcount
-            self.db_manager.conn.commit()
+                count = cur.rowcount
             
-            logger.info(f"Cleared {count} documents from batch {batch_id}")
+            logger.info(f"Cleared {count} documents from {len(batch_ids)} batch(es): {', '.join(batch_ids)}")
             return True
             
         except Exception as e:
-            logger.error(f"Error clearing batch {batch_id}: {e}")
-            self.db_manager.conn.rollback()
+            logger.error(f"Error clearing batches {', '.join(batch_ids)}: {e}")
             return False
     
-    def process_batch(self, stage: str, batch_size: int, batch_id: str = None, pause_seconds: int = 5) -> dict:
-        """Process a batch of documents."""
+    def _fetch_doc_types(self, document_ids: list) -> dict:
+        """Fetch document type names for many documents, querying only ids not already cached."""
+        ids = [str(doc_id) for doc_id in document_ids]
+        misses = [doc_id for doc_id in ids if doc_id not in self._type_cache]
+        
+        if misses:
+            try:
+                with self._cursor() as cur:
+                    cur.execute("""
+                        SELECT d.id, dt.name
+                        FROM documents d
+                        JOIN document_types dt ON d.document_type_id = dt.id
+                        WHERE d.id = ANY(%s::uuid[]);
+                    """, (misses,))
+                    
+                    found = {str(row[0]): row[1] for row in cur.fetchall()}
+                
+                # Cache untyped documents too so they aren't re-queried
+                for doc_id in misses:
+                    self._type_cache[doc_id] = found.get(doc_id, "unknown")
+                
+            except Exception as e:
+                logger.error(f"Error fetching document types: {e}")
+        
+        return {doc_id: self._type_cache[doc_id] for doc_id in ids if doc_id in self._type_cache}
+    
+    def _process_one(self, i: int, total: int, doc_id: str, doc_name: str, key: str, stage: str,
+                     batch_id: str, file_index: dict, doc_types: dict) -> bool:
+        """Index a single document through the RAG engine; returns True on success."""
+        try:
+            logger.info(f"Processing document {i+1}/{total}: {doc_id} ({doc_name})")
+            
+            # Find the document file
+            file_path = file_index.get(key)
+            
+            if file_path is None:
+                logger.warning(f"File not found for document {doc_id}")
+                return False
+            
+            # Get document type
+            doc_type = doc_types.get(str(doc_id), "unknown")
+            
+            # Process the document
+            logger.info(f"Indexing document: {file_path.name} (Type: {doc_type})")
+            
+            # Process the document
+            metadata = {
+                "document_type": doc_type,
+                "pipeline_stage": stage,
+                "original_filename": doc_name,
+                "batch_id": batch_id
+            }
+            
+            # Process through RAG engine, paced by the shared token bucket
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                self._bucket.acquire()
+                try:
+                    chunks = self.integration.rag_engine.process_document(
+                        document_path=file_path,
+                        document_id=doc_id,
+                        document_metadata=metadata
+                    )
+                    break
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt == RATE_LIMIT_RETRIES:
+                        raise
+                    self._bucket.slow_down()
+                    delay = self._backoff * (2 ** attempt)
+                    logger.warning(f"Rate limited on {doc_id}; rate now {self._bucket.rate:.2f}/s, retrying in {delay:.0f}s")
+                    time.sleep(delay)
+            
+            # Mark as processed in database
+            if chunks:
+                chunk_count = len(chunks)
+                self.mark_document_as_processed(doc_id, chunk_count, batch_id)
+                logger.info(f"Successfully processed document {doc_id}: {chunk_count} chunks")
+                return True
+            
+            logger.warning(f"Failed to process document: {doc_id}")
+            return False
+            
+        except Exception as e:
+            logger.error(f"Error processing document {doc_id}: {e}")
+            return False
+    
+    def process_batch(self, stage: str, batch_size: int, batch_id: str = None,
+                      max_workers: int = None, documents: list = None) -> dict:
+        """
+        Process a batch of documents (up to max_workers at a time, default config.WORKERS).
+        
+        If documents ((id, name, doc_key) tuples) are given they are processed as-is;
+        otherwise the next batch_size unprocessed documents are fetched.
+        Batch statistics come from the marker flushes rather than a separate query.
+        """
         # Generate batch ID if not provided
         if not batch_id:
             batch_id = str(uuid.uuid4())
@@ -225,7 +490,8 @@ class RAGBatchProcessor:
         logger.info(f"Starting batch {batch_id} with size {batch_size}")
         
         # Get documents to process
-        documents = self.get_unprocessed_documents(stage, batch_size)
+        if documents is None:
+            documents = self.get_unprocessed_documents(stage, batch_size)
         
         if not documents:
             logger.info("No unprocessed documents found")
@@ -235,73 +501,44 @@ class RAGBatchProcessor:
         
         processed_count = 0
         failed_count = 0
+        marked_count = 0
+        chunk_total = 0
         
-        # Get the pipeline processor for the specified stage
-        pipeline_stage = PipelineStage.CLEAN if stage == "clean" else PipelineStage.PROCESS
-        processor = PipelineProcessor(pipeline_stage)
-        stage_dir = processor.get_base_dirs()[f"stage_{stage}"]
+        # Stage directory from the cached base dirs; no PipelineProcessor
+        # (and its DB connection) is built per batch
+        stage_dir = PipelineProcessor.get_base_dirs()[f"stage_{stage}"]
         
-        # Process each document
-        for i, (doc_id, doc_name) in enumerate(documents):
-            try:
-                logger.info(f"Processing document {i+1}/{len(documents)}: {doc_id} ({doc_name})")
-                
-                # Find the document file
-                doc_files = list(stage_dir.glob(f"*doc{str(doc_id).replace('-', '')[:12]}*"))
-                
-                if not doc_files:
-                    logger.warning(f"File not found for document {doc_id}")
-                    failed_count += 1
-                    continue
-                
-                file_path = doc_files[0]
-                
-                # Get document type
-                doc_type = self.integration.db_manager.get_document_type(doc_id) or "unknown"
-                
-                # Process the document
-                logger.info(f"Indexing document: {file_path.name} (Type: {doc_type})")
-                
-                # Process the document
-                metadata = {
-                    "document_type": doc_type,
-                    "pipeline_stage": stage,
-                    "original_filename": doc_name,
-                    "batch_id": batch_id
-                }
-                
-                # Process through RAG engine
-                chunks = self.integration.rag_engine.process_document(
-                    document_path=file_path,
-                    document_id=doc_id,
-                    document_metadata=metadata
-                )
-                
-                # Mark as processed in database
-                if chunks:
-                    chunk_count = len(chunks)
-                    self.mark_document_as_processed(doc_id, chunk_count, batch_id)
+        # Index stage files by document key with one directory scan
+        file_index = index_stage_files(stage_dir)
+        
+        # Look up all document types for the batch at once
+        doc_types = self._fetch_doc_types([doc_id for doc_id, _, _ in documents])
+        
+        # Process documents on a bounded pool; RAG calls are I/O bound, so
+        # overlapping them raises throughput. Pacing is left to the token bucket.
+        workers = max(1, min(max_workers or config.WORKERS, len(documents)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for i, (doc_id, doc_name, key) in enumerate(documents):
+                futures.append(executor.submit(
+                    self._process_one, i, len(documents), doc_id, doc_name, key,
+                    stage, batch_id, file_index, doc_types
+                ))
+            
+            for future in futures:
+                if future.result():
                     processed_count += 1
-                    logger.info(f"Successfully processed document {doc_id}: {chunk_count} chunks")
+                    # Commit processed markers every FLUSH_EVERY documents, not per document
+                    if processed_count % FLUSH_EVERY == 0:
+                        marked, chunks = self._flush_pending()
+                        marked_count += marked
+                        chunk_total += chunks
                 else:
-                    logger.warning(f"Failed to process document: {doc_id}")
                     failed_count += 1
-                
-                # Pause between documents to respect rate limits
-                if i < len(documents) - 1:
-                    time.sleep(1)  # Short pause between documents
-                
-            except Exception as e:
-                logger.error(f"Error processing document {doc_id}: {e}")
-                failed_count += 1
-            
-            # Pause after batch_size/5 documents to avoid rate limits
-            if (i + 1) % max(batch_size // 5, 1) == 0 and i < len(documents) - 1:
-                logger.info(f"Pausing for {pause_seconds} seconds...")
-                time.sleep(pause_seconds)
         
-        # Get final batch statistics
-        batch_stats = self.get_batch_progress(batch_id)
+        # Write the remaining processed markers
+        marked, chunks = self._flush_pending()
+        batch_stats = self._batch_stats(batch_id, marked_count + marked, chunk_total + chunks)
         
         logger.info(f"Batch {batch_id} completed: {processed_count} processed, {failed_count} failed")
         
@@ -312,50 +549,106 @@ class RAGBatchProcessor:
             "status": "completed",
             "stats": batch_stats
         }
+    
+    async def process_batch_async(self, stage: str, batch_size: int, batch_id: str = None,
+                                  max_workers: int = None, documents: list = None) -> dict:
+        """
+        Async variant of process_batch: up to max_workers documents are in flight at once.
+        
+        Concurrency is bounded by a semaphore instead of fixed sleeps. The blocking
+        RAG and psycopg2 calls run via asyncio.to_thread, so marker flushes overlap
+        with in-flight RAG requests.
+        """
+        if not batch_id:
+            batch_id = str(uuid.uuid4())
+            
+        logger.info(f"Starting async batch {batch_id} with size {batch_size}")
         
-    def process_all(self, stage: str, batch_size: int = 500, pause_seconds: int = 5) -> dict:
-        """Process all unprocessed documents in batches."""
-        # Get total unprocessed documents
-        stats = self.get_batch_progress()
-        unprocessed_count = stats.get("unprocessed_documents", 0)
+        if documents is None:
+            documents = await asyncio.to_thread(self.get_unprocessed_documents, stage, batch_size)
         
-        if unprocessed_count == 0:
+        if not documents:
             logger.info("No unprocessed documents found")
-            return {"status": "completed", "message": "No documents to process"}
+            return {"batch_id": batch_id, "processed": 0, "status": "completed", "message": "No documents to process"}
         
-        logger.info(f"Processing all {unprocessed_count} unprocessed documents in batches of {batch_size}")
+        logger.info(f"Found {len(documents)} documents to process")
+        
+        stage_dir = PipelineProcessor.get_base_dirs()[f"stage_{stage}"]
+        file_index = await asyncio.to_thread(index_stage_files, stage_dir)
+        doc_types = await asyncio.to_thread(self._fetch_doc_types, [doc_id for doc_id, _, _ in documents])
+        
+        semaphore = asyncio.Semaphore(max(1, max_workers or config.WORKERS))
+        counts = {"processed": 0, "failed": 0, "marked": 0, "chunks": 0}
+        
+        async def flush():
+            marked, chunks = await asyncio.to_thread(self._flush_pending)
+            counts["marked"] += marked
+            counts["chunks"] += chunks
+        
+        async def worker(i, doc_id, doc_name, key):
+            async with semaphore:
+                ok = await asyncio.to_thread(
+                    self._process_one, i, len(documents), doc_id, doc_name, key,
+                    stage, batch_id, file_index, doc_types
+                )
+            if ok:
+                counts["processed"] += 1
+                if counts["processed"] % FLUSH_EVERY == 0:
+                    await flush()
+            else:
+                counts["failed"] += 1
+        
+        await asyncio.gather(*(worker(i, doc_id, doc_name, key)
+                               for i, (doc_id, doc_name, key) in enumerate(documents)))
+        
+        # Write the remaining processed markers
+        await flush()
+        batch_stats = self._batch_stats(batch_id, counts["marked"], counts["chunks"])
+        
+        logger.info(f"Batch {batch_id} completed: {counts['processed']} processed, {counts['failed']} failed")
+        
+        return {
+            "batch_id": batch_id,
+            "processed": counts["processed"],
+            "failed": counts["failed"],
+            "status": "completed",
+            "stats": batch_stats
+        }
+        
+    def process_all(self, stage: str, batch_size: int = 500, pause_seconds: int = 5, max_workers: int = None) -> dict:
+        """Process all unprocessed documents in batches, in a single streaming pass."""
+        documents = self.stream_unprocessed_documents(stage, chunk=min(batch_size, STREAM_ITERSIZE))
         
         total_processed = 0
         total_failed = 0
         batch_results = []
         
-        # Process in batches
-        while unprocessed_count > 0:
+        # Process in batches of batch_size pulled from the stream
+        for batch_documents in iter(lambda: list(itertools.islice(documents, batch_size)), []):
+            # Long pause between batches
+            if batch_results:
+                logger.info(f"Pausing for {pause_seconds*2} seconds between batches...")
+                time.sleep(pause_seconds * 2)
+            
             # Generate batch ID
             batch_id = str(uuid.uuid4())
             
             # Process batch
-            current_batch_size = min(batch_size, unprocessed_count)
-            logger.info(f"Processing batch of {current_batch_size} documents")
+            logger.info(f"Processing batch of {len(batch_documents)} documents")
             
-            result = self.process_batch(stage, current_batch_size, batch_id, pause_seconds)
+            result = self.process_batch(stage, len(batch_documents), batch_id, max_workers,
+                                        documents=batch_documents)
             batch_results.append(result)
             
             # Update counts
-            processed = result.get("processed", 0)
-            failed = result.get("failed", 0)
-            total_processed += processed
-            total_failed += failed
-            
-            # Update unprocessed count
-            unprocessed_count -= (processed + failed)
-            
-            # Long pause between batches
-            if unprocessed_count > 0:
-                logger.info(f"Pausing for {pause_seconds*2} seconds between batches...")
-                time.sleep(pause_seconds * 2)
+            total_processed += result.get("processed", 0)
+            total_failed += result.get("failed", 0)
             
-            logger.info(f"Progress: {total_processed} processed, {total_failed} failed, {unprocessed_count} remaining")
+            logger.info(f"Progress: {total_processed} processed, {total_failed} failed")
+        
+        if not batch_results:
+            logger.info("No unprocessed documents found")
+            return {"status": "completed", "message": "No documents to process"}
         
         logger.info(f"All processing complete: {total_processed} processed, {total_failed} failed")
         
@@ -377,7 +670,13 @@ if __name__ == "__main__":
     batch_parser.add_argument("--stage", "-s", type=str, default="clean", choices=["clean", "process"], 
                              help="Pipeline stage to process")
     batch_parser.add_argument("--size", "-n", type=int, default=500, help="Batch size")
-    batch_parser.add_argument("--pause", "-p", type=int, default=5, help="Pause between batches (seconds)")
+    batch_parser.add_argument("--rate", type=float, default=RATE_LIMIT_RPS, help="RAG requests per second")
+    batch_parser.add_argument("--burst", type=int, default=RATE_LIMIT_BURST, help="RAG request burst size")
+    batch_parser.add_argument("--pause", "-p", type=float, default=RATE_LIMIT_BACKOFF,
+                             help="Pause after a rate-limit error before retrying (seconds, doubles per retry)")
+    batch_parser.add_argument("--workers", "-w", type=int, default=None, help="Concurrent documents (default: config WORKERS)")
+    batch_parser.add_argument("--async", dest="use_async", action="store_true",
+                             help="Run documents concurrently on an asyncio loop (no fixed pauses)")
     
     # Process all
     all_parser = subparsers.add_parser("all", help="Process all unprocessed documents")
@@ -385,13 +684,19 @@ if __name__ == "__main__":
                           help="Pipeline stage to process")
     all_parser.add_argument("--size", "-n", type=int, default=500, help="Batch size")
     all_parser.add_argument("--pause", "-p", type=int, default=5, help="Pause between batches (seconds)")
+    all_parser.add_argument("--rate", type=float, default=RATE_LIMIT_RPS, help="RAG requests per second")
+    all_parser.add_argument("--burst", type=int, default=RATE_LIMIT_BURST, help="RAG request burst size")
+    all_parser.add_argument("--workers", "-w", type=int, default=None, help="Concurrent documents (default: config WORKERS)")
     
     # List batches
     list_parser = subparsers.add_parser("list", help="List all processing batches")
     
     # Clear batch
-    clear_parser = subparsers.add_parser("clear", help="Clear a batch to reprocess it")
-    clear_parser.add_argument("--batch-id", "-b", type=str, required=True, help="Batch ID to clear")
+    clear_parser = subparsers.add_parser("clear", help="Clear one or more batches to reprocess them")
+    clear_parser.add_argument("--batch-id", "-b", type=str, nargs="+", required=True, help="Batch ID(s) to clear")
+    
+    # Create indexes
+    indexes_parser = subparsers.add_parser("indexes", help="Create indexes for RAG batch queries (one-time migration)")
     
     # Get stats
     stats_parser = subparsers.add_parser("stats", help="Get processing statistics")
@@ -400,16 +705,22 @@ if __name__ == "__main__":
     args = parser.parse_args()
     
     # Initialize processor
-    processor = RAGBatchProcessor()
+    rate_args = {"rate": args.rate, "burst": args.burst} if args.command in ("batch", "all") else {}
+    if args.command == "batch":
+        rate_args["backoff"] = args.pause
+    processor = RAGBatchProcessor(**rate_args)
     
     # Execute command
     if args.command == "batch":
-        result = processor.process_batch(args.stage, args.size, pause_seconds=args.pause)
+        if args.use_async:
+            result = asyncio.run(processor.process_batch_async(args.stage, args.size, max_workers=args.workers))
+        else:
+            result = processor.process_batch(args.stage, args.size, max_workers=args.workers)
         print(f"Batch processing completed: {result['processed']} processed, {result.get('failed', 0)} failed")
         print(f"Batch ID: {result['batch_id']}")
         
     elif args.command == "all":
-        result = processor.process_all(args.stage, args.size, args.pause)
+        result = processor.process_all(args.stage, args.size, args.pause, args.workers)
         print(f"All processing completed: {result['total_processed']} processed, {result['total_failed']} failed")
         
     elif args.command == "list":
@@ -421,16 +732,26 @@ if __name__ == "__main__":
             print("-" * 100)
             
             for batch in batches:
-                print(f"{batch['batch_id']:<36} | {batch['started_at']:<20} | {batch['completed_at']:<20} | {batch['document_count']:<10} | {batch['chunk_count']:<10}")
+                # Timestamps arrive as datetimes; format before padding
+                started = batch['started_at'].strftime("%Y-%m-%d %H:%M:%S") if batch['started_at'] else ""
+                completed = batch['completed_at'].strftime("%Y-%m-%d %H:%M:%S") if batch['completed_at'] else ""
+                print(f"{batch['batch_id']:<36} | {started:<20} | {completed:<20} | {batch['document_count']:<10} | {batch['chunk_count']:<10}")
         else:
             print("No batches found")
             
     elif args.command == "clear":
-        success = processor.clear_batch(args.batch_id)
+        success = processor.clear_batches(args.batch_id)
+        batch_list = ", ".join(args.batch_id)
         if success:
-            print(f"Successfully cleared batch {args.batch_id}")
+            print(f"Successfully cleared batch(es) {batch_list}")
+        else:
+            print(f"Failed to clear batch(es) {batch_list}")
+            
+    elif args.command == "indexes":
+        if processor.create_indexes():
+            print("RAG indexes created")
         else:
-            print(f"Failed to clear batch {args.batch_id}")
+            print("Failed to create RAG indexes")
             
     elif args.command == "stats":
         stats = processor.get_batch_progress(args.batch_id)
@@ -7,13 +7,21 @@ SPM Edge RAG Integration - Connects the RAG system to the SPM Edge pipeline.
 """
 
 import os
+import re
 import sys
-import json
-import logging
+import asyncio
 import argparse
+import functools
+import hashlib
 from pathlib import Path
+import itertools
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from psycopg2.extras import execute_values, Json
 
 # Add the project root to the Python path
 project_root = str(Path(__file__).parent.parent.parent)
@@ -22,7 +30,7 @@ if project_root not in sys.path:
 
 # Now imports should work
 from config.config import config
-from src.pipeline.pipeline_processor import PipelineProcessor, PipelineStage
+from src.pipeline.pipeline_processor import PipelineProcessor, PipelineStage, doc_key, get_pipeline_logger, index_stage_files
 from src.pipeline.db_integration import DBManager
 from src.rag.rag_engine import RAGEngine
 
@@ -30,23 +38,68 @@ from src.rag.rag_engine import RAGEngine
 os.makedirs(config.LOG_DIR, exist_ok=True)
 LOG_FILE = os.path.join(config.LOG_DIR, "spm_rag_integration.log")
 
-# Configure logging
-logger = logging.getLogger("spm_rag_integration")
-logger.setLevel(logging.INFO)
-logger.propagate = False
+# Configure logging: records are only enqueued here; a background listener does
+# the console and file writes, so indexing workers don't contend on handler locks
+logger = get_pipeline_logger("spm_rag_integration", LOG_FILE)
 
-if not logger.handlers:
-    formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-    
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # File handler
-    file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+# Framework knowledge files: *_knowledge.json and *_framework_v*.xlsx
+_FRAMEWORK_RE = re.compile(r"(?:.*_knowledge\.json|.*_framework_v.*\.xlsx)$")
+
+# Shared embedding cache: unchanged chunk text skips the embedding API on re-index
+EMBEDDING_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        hash TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        vector REAL[] NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (hash, provider, model)
+    );
+"""
+
+@functools.lru_cache(maxsize=16)
+def _list_framework_files(framework_dir: str, type_filter: Optional[str], dir_mtime_ns: int) -> Tuple[Path, ...]:
+    """
+    Framework files in a directory, from one scan.
+    
+    dir_mtime_ns is only part of the cache key: adding, removing or renaming a
+    file changes the directory's mtime, which invalidates the cached listing.
+    """
+    with os.scandir(framework_dir) as entries:
+        return tuple(
+            Path(entry.path) for entry in entries
+            if _FRAMEWORK_RE.match(entry.name) and entry.is_file()
+            and (type_filter is None or type_filter in entry.name.lower())
+        )
+
+# Indexed-document markers are written in batches of this size
+MARK_BATCH_SIZE = 500
+
+# Knowledge-base answers kept in memory for repeated queries
+QUERY_LRU_SIZE = 256
+
+# Default analyze_document queries for compensation and other documents
+_COMPENSATION_QUERIES = (
+    "What are the main compensation components in this document?",
+    "What is the bonus structure described in this document?",
+    "What are the key performance metrics mentioned?",
+    "Are there any special conditions or exceptions mentioned?",
+)
+_DEFAULT_QUERIES = (
+    "What are the key topics covered in this document?",
+    "What are the main findings or conclusions?",
+    "Summarize this document in 3-5 bullet points.",
+)
+
+# Exact-match cache of analyze_document answers, keyed by document, query,
+# models and index size (so re-indexing invalidates earlier answers)
+QUERY_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS rag_query_cache (
+        key TEXT PRIMARY KEY,
+        answer JSONB NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+"""
 
 class SPMRagIntegration:
     """Integrates RAG capabilities with SPM Edge pipeline."""
@@ -54,7 +107,8 @@ class SPMRagIntegration:
     def __init__(self, 
                 embedding_model: str = "openai",
                 index_name: str = "spmedge",
-                index_type: str = "flat"):
+                index_type: str = "flat",
+                embedding_batch_size: int = 64):
         """
         Initialize the integration.
         
@@ -62,28 +116,160 @@ class SPMRagIntegration:
             embedding_model: Model to use for embeddings
             index_name: Name for the vector index
             index_type: Type of vector index
+            embedding_batch_size: Texts sent per embedding API request
         """
         self.db_manager = DBManager()
         
+        # Statements repeated per document / per stats call are prepared server-side
+        self.db_manager.prepare_statement(
+            "mark_indexed",
+            """
+            UPDATE documents
+            SET rag_data = jsonb_build_object('indexed', true, 'indexed_at', NOW(), 'chunk_count', $1::int)
+            WHERE id = $2::uuid
+            """
+        )
+        self.db_manager.prepare_statement(
+            "indexing_stats",
+            "SELECT COUNT(*), COUNT(*) FILTER (WHERE rag_data IS NOT NULL) FROM documents"
+        )
+        
         # Initialize RAG engine
         self.rag_engine = RAGEngine(
             embedding_model=embedding_model,
             index_name=index_name,
-            index_type=index_type
+            index_type=index_type,
+            embedding_batch_size=embedding_batch_size
         )
         
-        # Initialize pipeline processors for different stages
-        self.clean_processor = PipelineProcessor(PipelineStage.CLEAN)
-        self.process_processor = PipelineProcessor(PipelineStage.PROCESS)
+        # document_type_id (as text) -> type name; type names don't change mid-run
+        self._type_names: Dict[str, str] = {}
+        # document ID -> type name, for typed documents only
+        self._doc_type_names: Dict[str, str] = {}
+        
+        # Back the embedding generator with the shared database cache
+        if self._ensure_table(EMBEDDING_CACHE_DDL, "Embedding cache"):
+            self.rag_engine.embedding_generator.set_shared_cache(
+                self._lookup_embedding_cache, self._store_embedding_cache
+            )
+        self.query_cache_enabled = self._ensure_table(QUERY_CACHE_DDL, "Query cache")
+        
+        # (query, k, index version) -> query_knowledge_base result, least recently used first
+        self._query_lru: "OrderedDict[Tuple[str, int, int], Dict[str, Any]]" = OrderedDict()
+        self._query_lru_lock = threading.Lock()
         
         logger.info(f"SPM RAG Integration initialized with {embedding_model} embeddings")
     
-    def index_framework_documents(self, framework_type: str = None) -> int:
+    @contextmanager
+    def _cursor(self):
+        """
+        Yield a cursor on a pooled connection for one operation.
+        
+        Used by calls made from indexing worker threads, which must not share
+        db_manager's cursor.
+        """
+        with self.db_manager.connection() as conn, conn.cursor() as cur:
+            yield cur
+    
+    def _ensure_table(self, ddl: str, label: str) -> bool:
+        """Create a cache table if needed; False disables that cache."""
+        try:
+            with self._cursor() as cur:
+                cur.execute(ddl)
+            return True
+        except Exception as e:
+            logger.warning(f"{label} unavailable, continuing without it: {e}")
+            return False
+    
+    def _query_cache_key(self, document_id: str, query: str) -> str:
+        """Cache key for one analyze_document query against the current index."""
+        model_version = (f"{self.rag_engine.openai_client.model}|{self.rag_engine.embedding_generator.model_name}"
+                         f"|{len(self.rag_engine.vector_store.doc_ids)}")
+        return hashlib.sha256(f"{document_id}|{query}|{model_version}".encode("utf-8")).hexdigest()
+    
+    def _get_cached_insight(self, key: str) -> Optional[Dict[str, Any]]:
+        """Cached insight for a query key, or None (also on error)."""
+        if not self.query_cache_enabled:
+            return None
+        try:
+            with self._cursor() as cur:
+                cur.execute("SELECT answer FROM rag_query_cache WHERE key = %s", (key,))
+                row = cur.fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            logger.warning(f"Query cache lookup failed: {e}")
+            return None
+    
+    def _cache_insight(self, key: str, insight: Dict[str, Any]):
+        """Store an insight under its query key; errors are logged and ignored."""
+        if not self.query_cache_enabled:
+            return
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "INSERT INTO rag_query_cache (key, answer) VALUES (%s, %s) ON CONFLICT (key) DO NOTHING",
+                    (key, Json(insight))
+                )
+        except Exception as e:
+            logger.warning(f"Query cache store failed: {e}")
+    
+    def _lookup_embedding_cache(self, hashes: List[str], provider: str, model: str) -> Dict[str, List[float]]:
+        """Fetch cached embeddings for content hashes in one query; fails open to {}."""
+        try:
+            with self._cursor() as cur:
+                cur.execute(
+                    "SELECT hash, vector FROM embedding_cache WHERE provider = %s AND model = %s AND hash = ANY(%s)",
+                    (provider, model, list(hashes))
+                )
+                return dict(cur.fetchall())
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {e}")
+            return {}
+    
+    def _store_embedding_cache(self, entries: List[Tuple[str, List[float]]], provider: str, model: str):
+        """Upsert newly generated embeddings into the cache; errors are logged and ignored."""
+        try:
+            with self._cursor() as cur:
+                execute_values(
+                    cur,
+                    "INSERT INTO embedding_cache (hash, provider, model, vector) VALUES %s "
+                    "ON CONFLICT (hash, provider, model) DO NOTHING",
+                    [(content_hash, provider, model, vector) for content_hash, vector in entries]
+                )
+        except Exception as e:
+            logger.warning(f"Embedding cache store failed: {e}")
+    
+    def _index_one_framework(self, file_path: Path) -> int:
+        """
+        Index a single framework file.
+        
+        Returns:
+            Number of chunks indexed (0 on failure)
+        """
+        try:
+            # Generate framework ID
+            framework_id = f"framework_{file_path.stem}"
+            
+            # Process the document
+            logger.info(f"Indexing framework: {file_path.name}")
+            chunks = self.rag_engine.process_document(
+                document_path=file_path,
+                document_id=framework_id,
+                document_metadata={"document_type": "framework"}
+            )
+            return len(chunks) if chunks else 0
+            
+        except Exception as e:
+            logger.error(f"Error indexing framework {file_path.name}: {e}")
+            return 0
+    
+    def index_framework_documents(self, framework_type: str = None, max_workers: int = None) -> int:
         """
         Index framework documents from the knowledge files directory.
         
         Args:
             framework_type: Optional framework type filter
+            max_workers: Files indexed concurrently (default: config.WORKERS)
             
         Returns:
             Number of documents indexed
@@ -95,50 +281,35 @@ class SPMRagIntegration:
                 logger.error(f"Framework directory not found: {framework_dir}")
                 return 0
             
-            # Find framework files
-            framework_files = []
-            
-            # Look for JSON framework files
-            json_files = list(framework_dir.glob("*_knowledge.json"))
-            framework_files.extend(json_files)
-            
-            # Look for Excel framework files
-            excel_files = list(framework_dir.glob("*_framework_v*.xlsx"))
-            framework_files.extend(excel_files)
-            
-            # Filter by framework type if specified
-            if framework_type:
-                filtered_files = []
-                for file in framework_files:
-                    if framework_type.lower() in file.name.lower():
-                        filtered_files.append(file)
-                framework_files = filtered_files
+            # Find framework files (JSON and Excel), filtered by type if specified;
+            # the scan is skipped while the directory is unchanged
+            framework_files = list(_list_framework_files(
+                str(framework_dir),
+                framework_type.lower() if framework_type else None,
+                os.stat(framework_dir).st_mtime_ns
+            ))
             
             logger.info(f"Found {len(framework_files)} framework files to index")
             
-            # Process each framework file
+            if not framework_files:
+                logger.info("Successfully indexed 0 framework documents")
+                return 0
+            
+            # Index files concurrently; parsing and embedding are independent per file
             processed_count = 0
-            for file_path in framework_files:
-                try:
-                    # Generate framework ID
-                    framework_id = f"framework_{file_path.stem}"
-                    
-                    # Process the document
-                    logger.info(f"Indexing framework: {file_path.name}")
-                    chunks = self.rag_engine.process_document(
-                        document_path=file_path,
-                        document_id=framework_id,
-                        document_metadata={"document_type": "framework"}
-                    )
-                    
-                    if chunks:
+            workers = max(1, min(max_workers or config.WORKERS, len(framework_files)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(self._index_one_framework, file_path): file_path
+                           for file_path in framework_files}
+                
+                for future in as_completed(futures):
+                    file_path = futures[future]
+                    chunk_count = future.result()
+                    if chunk_count:
                         processed_count += 1
-                        logger.info(f"Indexed framework {file_path.name}: {len(chunks)} chunks")
+                        logger.info(f"Indexed framework {file_path.name}: {chunk_count} chunks")
                     else:
                         logger.warning(f"Failed to index framework: {file_path.name}")
-                        
-                except Exception as e:
-                    logger.error(f"Error indexing framework {file_path.name}: {e}")
             
             logger.info(f"Successfully indexed {processed_count} framework documents")
             return processed_count
@@ -147,91 +318,173 @@ class SPMRagIntegration:
             logger.error(f"Error indexing framework documents: {e}")
             return 0
     
-    def index_pipeline_documents(self, stage: PipelineStage, limit: int = 100) -> int:
+    def _fetch_type_names(self, type_ids: List[Any]) -> Dict[str, str]:
+        """Map document_type_id (as text) to type name, querying only ids not seen before."""
+        ids = {str(type_id) for type_id in type_ids if type_id is not None}
+        misses = [type_id for type_id in ids if type_id not in self._type_names]
+        if misses:
+            try:
+                with self._cursor() as cur:
+                    cur.execute(
+                        "SELECT id::text, name FROM document_types WHERE id::text = ANY(%s)",
+                        (misses,)
+                    )
+                    self._type_names.update(cur.fetchall())
+            except Exception as e:
+                logger.error(f"Error fetching document type names: {e}")
+        return {type_id: self._type_names[type_id] for type_id in ids if type_id in self._type_names}
+    
+    def _doc_type_cached(self, document_id: str) -> Optional[str]:
+        """
+        Document type name for a document, memoized per integration.
+        
+        Untyped documents (None) are not cached, so a type assigned later is picked up.
+        """
+        doc_type = self._doc_type_names.get(document_id)
+        if doc_type is None:
+            doc_type = self.db_manager.get_document_type(document_id)
+            if doc_type is not None:
+                self._doc_type_names[document_id] = doc_type
+        return doc_type
+    
+    def _index_pipeline_group(self, docs: List[Dict[str, Any]], file_index: Dict[str, Path], stage: PipelineStage,
+                              type_names: Dict[str, str]) -> List[Tuple[Any, Optional[int]]]:
+        """
+        Index a group of pipeline documents with one batched embedding pass.
+        
+        Returns:
+            (document ID, chunks indexed) per document; chunks is 0 on failure and
+            None if the document's stage file is missing
+        """
+        results = []
+        items = []
+        item_ids = []
+        
+        for doc in docs:
+            document_id = doc["id"]
+            try:
+                filename = doc["name"]
+                
+                # Find the document file in the prebuilt stage index
+                file_path = file_index.get(doc_key(document_id))
+                
+                if file_path is None:
+                    logger.warning(f"File not found for document {document_id}")
+                    results.append((document_id, None))
+                    continue
+                    
+                doc_type = type_names.get(str(doc.get("document_type_id")), "unknown")
+                
+                logger.info(f"Indexing document: {file_path.name} (Type: {doc_type})")
+                
+                # Prepare metadata
+                metadata = {
+                    "document_type": doc_type,
+                    "pipeline_stage": stage.value,
+                    "original_filename": filename
+                }
+                
+                # Add any existing metadata from the document
+                if "metadata" in doc and isinstance(doc["metadata"], dict):
+                    metadata.update(doc["metadata"])
+                
+                items.append((file_path, document_id, metadata))
+                item_ids.append(document_id)
+                
+            except Exception as e:
+                logger.error(f"Error indexing document {document_id}: {e}")
+                results.append((document_id, 0))
+        
+        if items:
+            # Chunks of the whole group share embedding requests
+            chunk_lists = self.rag_engine.process_documents(items)
+            results.extend((document_id, len(chunks)) for document_id, chunks in zip(item_ids, chunk_lists))
+        return results
+    
+    @staticmethod
+    def _log_group_results(futures, indexed_rows: List[Tuple[str, int]]) -> int:
+        """
+        Log each document of finished _index_pipeline_group futures and queue the
+        indexed ones as (document_id, chunk_count) in indexed_rows.
+        
+        Returns:
+            Number of documents indexed
+        """
+        indexed = 0
+        for future in futures:
+            for document_id, chunk_count in future.result():
+                if chunk_count is None:
+                    continue
+                if chunk_count:
+                    indexed += 1
+                    indexed_rows.append((str(document_id), chunk_count))
+                    logger.info(f"Indexed document {document_id}: {chunk_count} chunks")
+                else:
+                    logger.warning(f"Failed to index document: {document_id}")
+        return indexed
+    
+    def index_pipeline_documents(self, stage: PipelineStage, limit: int = 100, parallel_limit: int = 15,
+                                 group_size: int = 8) -> int:
         """
         Index documents from a specific pipeline stage.
         
+        Documents stream from the database and are indexed in groups whose chunks
+        share embedding requests; at most parallel_limit groups are in flight.
+        
         Args:
             stage: Pipeline stage to index from
             limit: Maximum number of documents to index
+            parallel_limit: Groups indexed concurrently
+            group_size: Documents per group (one batched embedding pass)
             
         Returns:
             Number of documents indexed
         """
         try:
-            # Get appropriate processor for the stage
-            if stage == PipelineStage.CLEAN:
-                processor = self.clean_processor
-                stage_dir = processor.get_base_dirs()["stage_clean"]
-            elif stage == PipelineStage.PROCESS:
-                processor = self.process_processor
-                stage_dir = processor.get_base_dirs()["stage_process"]
+            # Get the stage directory
+            if stage in (PipelineStage.CLEAN, PipelineStage.PROCESS):
+                stage_dir = PipelineProcessor.get_base_dirs()[f"stage_{stage.value}"]
             else:
                 logger.error(f"Unsupported pipeline stage for indexing: {stage}")
                 return 0
             
-            # Get documents that completed the stage
-            documents = processor.get_documents_for_stage(
-                current_stage=stage.value,
-                status="completed",
-                limit=limit
-            )
+            # Stream documents that completed the stage
+            documents = self.db_manager.iter_documents_for_stage(stage.value, "completed", limit=limit)
             
-            if not documents:
-                logger.warning(f"No documents found in {stage.value} stage")
-                return 0
-                
-            logger.info(f"Found {len(documents)} documents in {stage.value} stage")
+            # Resolve stage files with one directory scan; workers make no
+            # filesystem lookups or DB calls
+            file_index = index_stage_files(stage_dir)
             
-            # Process each document
+            # Submit groups as they are read, keeping at most parallel_limit in flight;
+            # each document is logged as its group completes
+            found_count = 0
             processed_count = 0
-            for doc in documents:
-                try:
-                    document_id = doc["id"]
-                    filename = doc["name"]
-                    
-                    # Find the document file
-                    doc_files = list(stage_dir.glob(f"*doc{str(document_id).replace('-', '')[:12]}*"))
+            in_flight = set()
+            indexed_rows = []  # marked as indexed every MARK_BATCH_SIZE documents
+            workers = max(1, parallel_limit)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for group in iter(lambda: list(itertools.islice(documents, group_size)), []):
+                    found_count += len(group)
+                    type_names = self._fetch_type_names([doc.get("document_type_id") for doc in group])
+                    in_flight.add(executor.submit(self._index_pipeline_group, group, file_index, stage, type_names))
                     
-                    if not doc_files:
-                        logger.warning(f"File not found for document {document_id}")
-                        continue
+                    if len(in_flight) >= workers:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        processed_count += self._log_group_results(done, indexed_rows)
                         
-                    file_path = doc_files[0]
-                    
-                    # Get document type
-                    doc_type = self.db_manager.get_document_type(document_id) or "unknown"
-                    
-                    # Process the document
-                    logger.info(f"Indexing document: {file_path.name} (Type: {doc_type})")
-                    
-                    # Prepare metadata
-                    metadata = {
-                        "document_type": doc_type,
-                        "pipeline_stage": stage.value,
-                        "original_filename": filename
-                    }
-                    
-                    # Add any existing metadata from the document
-                    if "metadata" in doc and isinstance(doc["metadata"], dict):
-                        metadata.update(doc["metadata"])
-                    
-                    # Process the document
-                    chunks = self.rag_engine.process_document(
-                        document_path=file_path,
-                        document_id=document_id,
-                        document_metadata=metadata
-                    )
-                    
-                    if chunks:
-                        processed_count += 1
-                        logger.info(f"Indexed document {document_id}: {len(chunks)} chunks")
-                    else:
-                        logger.warning(f"Failed to index document: {document_id}")
-                    
-                except Exception as e:
-                    logger.error(f"Error indexing document {doc.get('id')}: {e}")
+                        if len(indexed_rows) >= MARK_BATCH_SIZE:
+                            self.mark_documents_as_indexed(indexed_rows)
+                            indexed_rows = []
+                
+                processed_count += self._log_group_results(as_completed(in_flight), indexed_rows)
             
+            self.mark_documents_as_indexed(indexed_rows)
+            
+            if not found_count:
+                logger.warning(f"No documents found in {stage.value} stage")
+                return 0
+            
+            logger.info(f"Found {found_count} documents in {stage.value} stage")
             logger.info(f"Successfully indexed {processed_count} documents from {stage.value} stage")
             return processed_count
             
@@ -239,6 +492,114 @@ class SPMRagIntegration:
             logger.error(f"Error indexing {stage.value} stage documents: {e}")
             return 0
     
+    async def process_all_async(self, stage: PipelineStage, batch_size: int = 50, parallel_limit: int = 15) -> int:
+        """
+        Index every unindexed document of a stage through a three-stage pipeline.
+        
+        A reader streams batches of batch_size documents from the server-side cursor,
+        parallel_limit workers index batches (one batched embedding pass each), and a
+        writer logs results and bulk-marks indexed documents. Bounded queues between
+        the stages overlap DB reads, embedding calls and DB writes.
+        
+        Returns:
+            Number of documents indexed
+        """
+        if stage not in (PipelineStage.CLEAN, PipelineStage.PROCESS):
+            logger.error(f"Unsupported pipeline stage for indexing: {stage}")
+            return 0
+        
+        stage_dir = PipelineProcessor.get_base_dirs()[f"stage_{stage.value}"]
+        file_index = await asyncio.to_thread(index_stage_files, stage_dir)
+        documents = self.db_manager.iter_documents_for_stage(stage.value, "completed")
+        
+        batches: asyncio.Queue = asyncio.Queue(maxsize=parallel_limit)
+        results: asyncio.Queue = asyncio.Queue()
+        
+        async def read():
+            # Stage A: stream batches (and their type names) from the database
+            while True:
+                batch = await asyncio.to_thread(lambda: list(itertools.islice(documents, batch_size)))
+                if not batch:
+                    break
+                type_names = await asyncio.to_thread(
+                    self._fetch_type_names, [doc.get("document_type_id") for doc in batch]
+                )
+                await batches.put((batch, type_names))
+            for _ in range(parallel_limit):
+                await batches.put(None)
+        
+        async def index():
+            # Stage B: index one batch at a time
+            while (item := await batches.get()) is not None:
+                batch, type_names = item
+                try:
+                    await results.put(await asyncio.to_thread(
+                        self._index_pipeline_group, batch, file_index, stage, type_names
+                    ))
+                except Exception as e:
+                    logger.error(f"Error indexing batch of {len(batch)} documents: {e}")
+            await results.put(None)
+        
+        async def write() -> int:
+            # Stage C: log results and bulk-mark indexed documents
+            indexed = 0
+            indexed_rows = []
+            remaining_workers = parallel_limit
+            while remaining_workers:
+                group_results = await results.get()
+                if group_results is None:
+                    remaining_workers -= 1
+                    continue
+                for document_id, chunk_count in group_results:
+                    if chunk_count is None:
+                        continue
+                    if chunk_count:
+                        indexed += 1
+                        indexed_rows.append((str(document_id), chunk_count))
+                        logger.info(f"Indexed document {document_id}: {chunk_count} chunks")
+                    else:
+                        logger.warning(f"Failed to index document: {document_id}")
+                if len(indexed_rows) >= MARK_BATCH_SIZE:
+                    await asyncio.to_thread(self.mark_documents_as_indexed, indexed_rows)
+                    indexed_rows = []
+            await asyncio.to_thread(self.mark_documents_as_indexed, indexed_rows)
+            return indexed
+        
+        outcomes = await asyncio.gather(read(), write(), *(index() for _ in range(parallel_limit)))
+        indexed_count = outcomes[1]
+        logger.info(f"Successfully indexed {indexed_count} documents from {stage.value} stage")
+        return indexed_count
+    
+    def _analyze_one(self, document_id: str, query: str) -> Tuple[str, Dict[str, Any]]:
+        """Answer one analysis query, reusing a cached answer when available."""
+        # Reuse the stored answer if this query already ran against the same index
+        cache_key = self._query_cache_key(document_id, query)
+        cached = self._get_cached_insight(cache_key)
+        if cached is not None:
+            logger.info(f"Using cached answer for document {document_id} query: '{query}'")
+            return query, cached
+        
+        # Generate insight for this query
+        logger.info(f"Analyzing document {document_id} with query: '{query}'")
+        
+        # Modified to remove filter_fn parameter
+        result = self.rag_engine.query(
+            query=query,
+            k=5,
+            mode="hybrid"  # Use hybrid search mode instead of filter_fn
+        )
+        
+        insight = {
+            "answer": result.get("answer"),
+            "sources": [
+                doc.get("metadata", {}).get("chunk_id")
+                for doc in result.get("documents", [])[:3]
+            ]
+        }
+        if result.get("answer"):
+            self._cache_insight(cache_key, insight)
+        return query, insight
+    
     def analyze_document(self, document_id: str, queries: List[str] = None) -> Dict[str, Any]:
         """
         Generate RAG-powered insights for a specific document.
@@ -252,46 +613,18 @@ class SPMRagIntegration:
         """
         try:
             # Get document type and metadata
-            doc_type = self.db_manager.get_document_type(document_id)
+            doc_type = self._doc_type_cached(document_id)
             
             # Default queries based on document type
             if not queries:
-                if "compensation" in (doc_type or "").lower():
-                    queries = [
-                        "What are the main compensation components in this document?",
-                        "What is the bonus structure described in this document?",
-                        "What are the key performance metrics mentioned?",
-                        "Are there any special conditions or exceptions mentioned?"
-                    ]
-                else:
-                    queries = [
-                        "What are the key topics covered in this document?",
-                        "What are the main findings or conclusions?",
-                        "Summarize this document in 3-5 bullet points."
-                    ]
+                queries = (_COMPENSATION_QUERIES if doc_type and "compensation" in doc_type.casefold()
+                           else _DEFAULT_QUERIES)
             
-            # Run queries and collect insights
+            # Run the independent queries concurrently; map keeps the query order
             insights = {}
-            
-            for query in queries:
-                # Generate insight for this query
-                logger.info(f"Analyzing document {document_id} with query: '{query}'")
-                
-                # Modified to remove filter_fn parameter
-                result = self.rag_engine.query(
-                    query=query,
-                    k=5,
-                    mode="hybrid"  # Use hybrid search mode instead of filter_fn
-                )
-                
-                # Store the insight
-                insights[query] = {
-                    "answer": result.get("answer"),
-                    "sources": [
-                        doc.get("metadata", {}).get("chunk_id")
-                        for doc in result.get("documents", [])[:3]
-                    ]
-                }
+            with ThreadPoolExecutor(max_workers=max(1, min(8, len(queries)))) as executor:
+                for query, insight in executor.map(lambda q: self._analyze_one(document_id, q), queries):
+                    insights[query] = insight
             
             # Create final analysis result
             analysis = {
@@ -325,38 +658,29 @@ class SPMRagIntegration:
             Success status
         """
         try:
-            # Get current metadata
-            self.db_manager.cursor.execute(
-                "SELECT metadata FROM documents WHERE id = %s",
-                (document_id,)
-            )
-            result = self.db_manager.cursor.fetchone()
+            # Merge rag_analysis into the metadata server-side in one atomic statement
+            with self._cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE documents
+                    SET metadata = COALESCE(metadata, '{}'::jsonb) || jsonb_build_object('rag_analysis', %s::jsonb),
+                        updated_at = NOW()
+                    WHERE id = %s
+                    RETURNING 1
+                    """,
+                    (Json(analysis), document_id)
+                )
+                found = cur.rowcount > 0
             
-            if not result:
+            if not found:
                 logger.error(f"Document {document_id} not found in database")
                 return False
-                
-            # Parse existing metadata
-            metadata = result[0] or {}
-            if isinstance(metadata, str):
-                metadata = json.loads(metadata)
-            
-            # Add rag_analysis to metadata
-            metadata["rag_analysis"] = analysis
-            
-            # Update database
-            self.db_manager.cursor.execute(
-                "UPDATE documents SET metadata = %s, updated_at = NOW() WHERE id = %s",
-                (json.dumps(metadata), document_id)
-            )
-            self.db_manager.conn.commit()
             
             logger.info(f"Saved RAG analysis to database for document {document_id}")
             return True
             
         except Exception as e:
             logger.error(f"Error saving analysis to database for document {document_id}: {e}")
-            self.db_manager.conn.rollback()
             return False
     
     def query_knowledge_base(self, query: str, k: int = 5) -> Dict[str, Any]:
@@ -370,7 +694,22 @@ class SPMRagIntegration:
         Returns:
             Query results
         """
-        return self.rag_engine.query(query=query, k=k)
+        # The vector store size stands in for an index version: any add invalidates
+        key = (query, k, len(self.rag_engine.vector_store.doc_ids))
+        with self._query_lru_lock:
+            if key in self._query_lru:
+                self._query_lru.move_to_end(key)
+                return self._query_lru[key]
+        
+        result = self.rag_engine.query(query=query, k=k)
+        if "error" in result:
+            return result
+        
+        with self._query_lru_lock:
+            self._query_lru[key] = result
+            if len(self._query_lru) > QUERY_LRU_SIZE:
+                self._query_lru.popitem(last=False)
+        return result
     
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -383,26 +722,15 @@ class SPMRagIntegration:
         
         # Get document counts from database
         try:
-            self.db_manager.cursor.execute(
-                "SELECT COUNT(*) FROM documents"
-            )
-            total_documents = self.db_manager.cursor.fetchone()[0]
-            
-            self.db_manager.cursor.execute(
-                "SELECT document_type_id, COUNT(*) FROM documents GROUP BY document_type_id"
-            )
-            document_types = {}
-            for type_id, count in self.db_manager.cursor.fetchall():
-                doc_type = "unknown"
-                try:
-                    self.db_manager.cursor.execute(
-                        "SELECT name FROM document_types WHERE id = %s",
-                        (type_id,)
-                    )
-                    doc_type = self.db_manager.cursor.fetchone()[0]
-                except:
-                    pass
-                document_types[doc_type] = count
+            # Per-type counts with names in one query; the total is their sum
+            self.db_manager.cursor.execute("""
+                SELECT COALESCE(dt.name, 'unknown') AS name, COUNT(*)
+                FROM documents d
+                LEFT JOIN document_types dt ON dt.id = d.document_type_id
+                GROUP BY 1
+            """)
+            document_types = dict(self.db_manager.cursor.fetchall())
+            total_documents = sum(document_types.values())
                 
             return {
                 "rag_engine": rag_stats,
@@ -423,13 +751,9 @@ class SPMRagIntegration:
     def get_indexing_stats(self):
         """Get statistics about indexed vs. unindexed documents."""
         try:
-            # Get total document count
-            self.db_manager.cursor.execute("SELECT COUNT(*) FROM documents")
-            total_docs = self.db_manager.cursor.fetchone()[0]
-            
-            # Get indexed document count
-            self.db_manager.cursor.execute("SELECT COUNT(*) FROM documents WHERE rag_data IS NOT NULL")
-            indexed_docs = self.db_manager.cursor.fetchone()[0]
+            # Total and indexed document counts in one prepared scan
+            self.db_manager.cursor.execute("EXECUTE indexing_stats;")
+            total_docs, indexed_docs = self.db_manager.cursor.fetchone()
             
             return {
                 "total_documents": total_docs,
@@ -445,18 +769,7 @@ class SPMRagIntegration:
         """Mark a document as indexed in the database."""
         try:
             # Update the rag_data field in the documents table
-            self.db_manager.cursor.execute(
-                """
-                UPDATE documents 
-                SET rag_data = jsonb_build_object(
-                    'indexed', true,
-                    'indexed_at', NOW(),
-                    'chunk_count', %s
-                )
-                WHERE id = %s
-                """,
-                (chunk_count, document_id)
-            )
+            self.db_manager.cursor.execute("EXECUTE mark_indexed (%s, %s);", (chunk_count, str(document_id)))
             self.db_manager.conn.commit()
             logger.info(f"Marked document {document_id} as indexed with {chunk_count} chunks")
             return True
@@ -464,6 +777,35 @@ class SPMRagIntegration:
             logger.error(f"Error marking document {document_id} as indexed: {e}")
             self.db_manager.conn.rollback()
             return False
+    
+    def mark_documents_as_indexed(self, rows: List[Tuple[str, int]]) -> bool:
+        """Mark many (document_id, chunk_count) documents as indexed in one transaction."""
+        if not rows:
+            return True
+        try:
+            # Update the rag_data field in the documents table
+            with self._cursor() as cur:
+                execute_values(
+                    cur,
+                    """
+                    UPDATE documents AS d
+                    SET rag_data = jsonb_build_object(
+                        'indexed', true,
+                        'indexed_at', NOW(),
+                        'chunk_count', v.chunk_count
+                    )
+                    FROM (VALUES %s) AS v(id, chunk_count)
+                    WHERE d.id = v.id::uuid
+                    """,
+                    [(str(document_id), chunk_count) for document_id, chunk_count in rows],
+                    template="(%s, %s)",
+                    page_size=MARK_BATCH_SIZE
+                )
+            logger.info(f"Marked {len(rows)} documents as indexed")
+            return True
+        except Exception as e:
+            logger.error(f"Error marking {len(rows)} documents as indexed: {e}")
+            return False
         
 # Example usage when run as script
 if __name__ == "__main__":
@@ -475,17 +817,22 @@ if __name__ == "__main__":
     # Index framework documents command
     index_framework_parser = subparsers.add_parser("index-framework", help="Index framework documents")
     index_framework_parser.add_argument("--type", "-t", type=str, help="Framework type to index")
+    index_framework_parser.add_argument("--workers", "-w", type=int, default=None,
+                                       help="Files indexed concurrently (default: config WORKERS)")
     
     # Index pipeline documents command
     index_pipeline_parser = subparsers.add_parser("index-pipeline", help="Index pipeline documents")
     index_pipeline_parser.add_argument("--stage", "-s", type=str, required=True,
                                       choices=["clean", "process"], help="Pipeline stage to index")
     index_pipeline_parser.add_argument("--limit", "-l", type=int, default=100, help="Maximum documents to index")
-    # Add this to your command line arguments in spm_rag_integration.py
+    index_pipeline_parser.add_argument("--parallel", "-p", type=int, default=15, help="Document groups indexed concurrently")
+    
+    # Process all documents command
     process_all_parser = subparsers.add_parser("process-all", help="Process all documents")
     process_all_parser.add_argument("--batch-size", type=int, default=50, help="Documents per batch")
     process_all_parser.add_argument("--stage", type=str, default="clean", choices=["clean", "process"], help="Pipeline stage to process")
-                                
+    process_all_parser.add_argument("--parallel", "-p", type=int, default=15, help="Batches indexed concurrently")
+    
     # Analyze document command
     analyze_parser = subparsers.add_parser("analyze", help="Analyze a specific document")
     analyze_parser.add_argument("--document-id", "-d", type=str, required=True, help="Document ID to analyze")
@@ -506,7 +853,7 @@ if __name__ == "__main__":
     
     if args.command == "index-framework":
         # Index framework documents
-        count = integration.index_framework_documents(framework_type=args.type)
+        count = integration.index_framework_documents(framework_type=args.type, max_workers=args.workers)
         print(f"Indexed {count} framework documents")
         
     elif args.command == "index-pipeline":
@@ -522,7 +869,14 @@ if __name__ == "__main__":
             exit(1)
             
         # Index pipeline documents
-        count = integration.index_pipeline_documents(stage=stage, limit=args.limit)
+        count = integration.index_pipeline_documents(stage=stage, limit=args.limit, parallel_limit=args.parallel)
+        print(f"Indexed {count} documents from {args.stage} stage")
+        
+    elif args.command == "process-all":
+        stage = PipelineStage.CLEAN if args.stage == "clean" else PipelineStage.PROCESS
+        
+        # Index every unindexed document through the reader/indexer/writer pipeline
+        count = asyncio.run(integration.process_all_async(stage, args.batch_size, args.parallel))
         print(f"Indexed {count} documents from {args.stage} stage")
         
     elif args.command == "analyze":
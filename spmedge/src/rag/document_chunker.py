@@ -7,12 +7,64 @@ Document Chunker - Creates semantic chunks from processed documents for RAG.
 - Implements content-aware density-based chunking
 """
 
-import re
+import os
+import sys
 import json
+import mmap
 import logging
+import functools
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterator, Set, Callable
+
+# Prefer the third-party regex engine (faster matching on the \w-heavy table and formula
+# patterns); stdlib re is the fallback, which only accepts possessive quantifiers from 3.11
+try:
+    import regex as re
+    REGEX_AVAILABLE = True
+except ImportError:
+    import re
+    REGEX_AVAILABLE = False
+
+POSSESSIVE_AVAILABLE = REGEX_AVAILABLE or sys.version_info >= (3, 11)
+
+def _portable_patterns(patterns: List[str]) -> List[str]:
+    """Patterns with possessive ++ relaxed to + where the engine lacks them (same matches, more backtracking)."""
+    return patterns if POSSESSIVE_AVAILABLE else [pattern.replace("++", "+") for pattern in patterns]
+
+# Parse JSON-wrapped documents with orjson when installed (straight from bytes, several
+# times faster); json.loads accepts the same bytes
+_json_loads: Callable[[bytes], Any]
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Import Hyperscan conditionally; without it break scanning falls back to re
+try:
+    import hyperscan
+    HYPERSCAN_AVAILABLE = True
+except ImportError:
+    HYPERSCAN_AVAILABLE = False
+
+# Import Numba conditionally; without it density counting uses str.translate / NumPy
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Import pyahocorasick conditionally; without it literal keywords stay in the regexes
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
 
 from config.config import config
 
@@ -20,13 +72,141 @@ from config.config import config
 logger = logging.getLogger("document_chunker")
 logger.setLevel(logging.INFO)
 
+# Semantic break pattern classes
+BREAK_SECTION, BREAK_TABLE, BREAK_FORMULA = range(3)
+
+def _build_automaton(words: List[str]) -> Any:
+    """Aho-Corasick automaton matching all literal words in one pass (each reports its length)."""
+    automaton = ahocorasick.Automaton()
+    for word in words:
+        automaton.add_word(word, len(word))
+    automaton.make_automaton()
+    return automaton
+
+# Per-thread Hyperscan scratch space (scratch must not be shared across threads)
+_hs_local = threading.local()
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _count_flagged_bytes(buf: np.ndarray, lut: np.ndarray) -> int:
+        """Count the bytes of buf flagged in a 256-entry lookup table, in one compiled loop."""
+        count = 0
+        for byte in buf:
+            if lut[byte]:
+                count += 1
+        return count
+
+@functools.lru_cache(maxsize=None)
+def _hyperscan_database(expressions: Tuple[Tuple[str, int], ...]) -> Optional[Tuple[Any, List[int]]]:
+    """
+    Compile (pattern, break class) pairs into one Hyperscan block-mode database.
+    
+    Returns:
+        Tuple of (database, break class per expression id), or None if compilation fails
+    """
+    try:
+        db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+        db.compile(
+            # Hyperscan has no possessive quantifiers; it never backtracks, so plain ones match the same
+            expressions=[pattern.replace("++", "+").encode("utf-8") for pattern, _ in expressions],
+            ids=list(range(len(expressions))),
+            elements=len(expressions),
+            flags=[
+                hyperscan.HS_FLAG_SOM_LEFTMOST | hyperscan.HS_FLAG_MULTILINE
+                | (hyperscan.HS_FLAG_CASELESS if kind == BREAK_FORMULA else 0)
+                for _, kind in expressions
+            ]
+        )
+        return db, [kind for _, kind in expressions]
+    except Exception as e:
+        logger.warning(f"⚠️ Hyperscan compilation failed, using re for break scanning: {e}")
+        return None
+
 class DocumentChunker:
     """Handles semantic chunking of documents for the RAG system."""
     
+    # "Information-rich" characters counted by _calculate_content_density: deleted via
+    # str.translate for ASCII text, or tested per UTF-8 byte against a lookup table otherwise
+    # (they are all ASCII, so multi-byte sequences never match)
+    _special_chars_delete = str.maketrans('', '', '0123456789$%.,;:()[]{}')
+    _special_lut: np.ndarray = np.zeros(256, dtype=np.bool_)
+    _special_lut[[ord(c) for c in '0123456789$%.,;:()[]{}']] = True
+    
+    # Paragraph and sentence boundaries, compiled once
+    _para_split_re = re.compile(r'\n\s*\n')
+    _sentence_split_re = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+    
+    # Key business terms (commonly found in compensation plans)
+    business_terms = ['quota', 'bonus', 'commission', 'revenue', 'sales', 'target', 'goal', 'payout', 'incentive']
+    
+    # Structure indicators as one alternation, so each text is scanned once and matches
+    # are counted by group name. Business terms are counted in a separate pass (by an
+    # automaton with Aho-Corasick), so a term inside a table row still counts
+    _density_re = re.compile(
+        r'(?P<bullet>[•\*\-]\s+)'
+        r'|(?P<heading>#+\s+|\n[A-Z][A-Z\s]+[:\n])'
+        r'|(?P<table_row>\|\s*[\w\s]+\s*\|)'
+    )
+    _business_terms_re = re.compile('|'.join(business_terms), re.IGNORECASE)
+    _business_terms_automaton: Any = _build_automaton(business_terms) if AHOCORASICK_AVAILABLE else None
+    
+    # Patterns for detecting semantic breaks
+    section_patterns = [
+        r'\n\s*#{1,6}\s+',  # Markdown headings
+        r'\n\s*[A-Z][A-Z\s]+:',  # ALL CAPS section headers
+        r'\n\s*\d+\.\s+[A-Z]',  # Numbered sections
+        r'\n\s*•\s+',  # Bullet points
+        r'\n\s*\*\s+',  # Asterisk bullet points
+        r'\n\s*-\s+',  # Hyphen bullet points
+        r'\n\s*[IVX]+\.\s+',  # Roman numeral sections
+        r'\n\s*[A-Z]\.\s+',  # Lettered sections
+        r'\n\s*Article\s+\d+',  # Legal document articles
+        r'\n\s*Section\s+\d+',  # Legal document sections
+        r'\n\s*ARTICLE\s+[IVX]+',  # Legal document ARTICLES (Roman numerals)
+        r'\n\s*SECTION\s+\d+',  # Legal document SECTIONS
+    ]
+    
+    # Common document sections: literal keywords after a line break. With Aho-Corasick
+    # they are matched by one automaton pass rather than as regex alternation branches
+    section_keywords = ['Purpose:', 'Overview:', 'Introduction:', 'Background:', 'Summary:',
+                        'Conclusion:', 'Eligibility:', 'Compensation:', 'Commission:']
+    section_keyword_patterns = [r'\n\s*' + re.escape(keyword) for keyword in section_keywords]
+    _section_automaton: Any = _build_automaton(section_keywords) if AHOCORASICK_AVAILABLE else None
+    
+    # Table patterns (possessive quantifiers where giving back characters can never
+    # produce a match, so failed attempts don't backtrack)
+    table_patterns = [
+        r'(\|\s*[\w\s]++\s*\|)+',  # Markdown tables
+        r'(\+[-+]+\+)',  # ASCII tables
+        r'(\d++\.?\d*%\s+\d++\.?\d*%)', # Multiple percentages (likely a table row)
+        r'(\$\d++\.?\d*\s+\$\d++\.?\d*)', # Multiple dollar amounts (likely a table row)
+    ]
+    
+    # Formula patterns (especially for compensation plans)
+    formula_patterns = [
+        r'(\d++\.?\d*%\s+of\s+[\w\s]+)',  # Percentage formulas
+        r'(\$\d++\.?\d*\s+per\s+[\w\s]+)',  # Monetary formulas
+        r'(quota.*?attainment)',  # Quota attainment
+        r'(target.*?bonus)',  # Target bonus
+        r'(bonus.*?calculation)',  # Bonus calculation
+        r'(commission.*?rate)',  # Commission rate
+    ]
+    
+    # Compiled once at import: all three classes fused into one alternation so the text
+    # is scanned once, with the named group of each match giving its class. Scoped flags
+    # keep each class's matching (ASCII tables and formulas, case-insensitive formulas)
+    break_regex = re.compile(
+        f"(?P<section>{'|'.join(section_patterns if AHOCORASICK_AVAILABLE else section_patterns + section_keyword_patterns)})"
+        f"|(?P<table>(?a:{'|'.join(_portable_patterns(table_patterns))}))"
+        f"|(?P<formula>(?ai:{'|'.join(_portable_patterns(formula_patterns))}))"
+    )
+    
     def __init__(self, 
                  chunk_size: int = 512, 
                  chunk_overlap: int = 50,
-                 max_chunks_per_doc: int = 100):
+                 max_chunks_per_doc: int = 100,
+                 include_density: bool = False,
+                 use_hyperscan: bool = False) -> None:
         """
         Initialize chunker with configuration.
         
@@ -34,94 +214,93 @@ class DocumentChunker:
             chunk_size: Target size of each chunk in tokens (approximate)
             chunk_overlap: Number of tokens to overlap between chunks
             max_chunks_per_doc: Maximum chunks to create per document
+            include_density: Add each chunk's content density to its metadata
+            use_hyperscan: Find break positions with Hyperscan when it is installed.
+                Hyperscan reports every match (overlapping ones included) with its
+                leftmost start, not re's leftmost non-overlapping matches, so the
+                breaks and resulting chunks differ from the default re scan
         """
-        self.chunk_size = chunk_size
-        self.chunk_overlap = chunk_overlap
-        self.max_chunks_per_doc = max_chunks_per_doc
-        self.avg_chars_per_token = 4  # Approximation for token counting
-        
-        # Patterns for detecting semantic breaks
-        self.section_patterns = [
-            r'\n\s*#{1,6}\s+',  # Markdown headings
-            r'\n\s*[A-Z][A-Z\s]+:',  # ALL CAPS section headers
-            r'\n\s*\d+\.\s+[A-Z]',  # Numbered sections
-            r'\n\s*•\s+',  # Bullet points
-            r'\n\s*\*\s+',  # Asterisk bullet points
-            r'\n\s*-\s+',  # Hyphen bullet points
-            r'\n\s*[IVX]+\.\s+',  # Roman numeral sections
-            r'\n\s*[A-Z]\.\s+',  # Lettered sections
-            r'\n\s*Article\s+\d+',  # Legal document articles
-            r'\n\s*Section\s+\d+',  # Legal document sections
-            r'\n\s*ARTICLE\s+[IVX]+',  # Legal document ARTICLES (Roman numerals)
-            r'\n\s*SECTION\s+\d+',  # Legal document SECTIONS
-            r'\n\s*Purpose:',  # Common document sections
-            r'\n\s*Overview:',
-            r'\n\s*Introduction:',
-            r'\n\s*Background:',
-            r'\n\s*Summary:',
-            r'\n\s*Conclusion:',
-            r'\n\s*Eligibility:',
-            r'\n\s*Compensation:',
-            r'\n\s*Commission:',
-        ]
-        
-        # Table patterns
-        self.table_patterns = [
-            r'(\|\s*[\w\s]+\s*\|)+',  # Markdown tables
-            r'(\+[-+]+\+)',  # ASCII tables
-            r'(\d+\.?\d*%\s+\d+\.?\d*%)', # Multiple percentages (likely a table row)
-            r'(\$\d+\.?\d*\s+\$\d+\.?\d*)', # Multiple dollar amounts (likely a table row)
-        ]
-        
-        # Formula patterns (especially for compensation plans)
-        self.formula_patterns = [
-            r'(\d+\.?\d*%\s+of\s+[\w\s]+)',  # Percentage formulas
-            r'(\$\d+\.?\d*\s+per\s+[\w\s]+)',  # Monetary formulas
-            r'(quota.*?attainment)',  # Quota attainment
-            r'(target.*?bonus)',  # Target bonus
-            r'(bonus.*?calculation)',  # Bonus calculation
-            r'(commission.*?rate)',  # Commission rate
-        ]
-        
-        # Compiled regex for better performance
-        self.section_regex = re.compile('|'.join(self.section_patterns), re.MULTILINE)
-        self.table_regex = re.compile('|'.join(self.table_patterns), re.MULTILINE)
-        self.formula_regex = re.compile('|'.join(self.formula_patterns), re.MULTILINE | re.IGNORECASE)
+        self.chunk_size: int = chunk_size
+        self.chunk_overlap: int = chunk_overlap
+        self.max_chunks_per_doc: int = max_chunks_per_doc
+        self.include_density: bool = include_density
+        self.use_hyperscan: bool = use_hyperscan
+        self.avg_chars_per_token: int = 4  # Approximation for token counting
+        
+        # Size limits in characters, so hot loops compare running lengths instead of estimating tokens
+        self._chunk_chars: int = chunk_size * self.avg_chars_per_token
+        self._max_chunk_chars: int = int(self._chunk_chars * 1.5)
         
     def _estimate_tokens(self, text: str) -> int:
         """Estimate the number of tokens in a text string."""
         return len(text) // self.avg_chars_per_token
     
-    def _find_semantic_breaks(self, text: str) -> List[int]:
-        """Find positions of semantic breaks in the text."""
-        # Find all matches of semantic patterns
-        matches = list(self.section_regex.finditer(text))
-        break_positions = [m.start() for m in matches]
-        
-        # Add breaks for tables
-        table_matches = list(self.table_regex.finditer(text))
-        for match in table_matches:
+    def _hyperscan_breaks(self, text: str) -> Optional[List[int]]:
+        """Find break positions with a single Hyperscan pass, or None if disabled or unavailable."""
+        # Hyperscan reports byte offsets, which only equal str offsets for ASCII text
+        if not self.use_hyperscan or not HYPERSCAN_AVAILABLE or not text.isascii():
+            return None
+        
+        compiled = _hyperscan_database(
+            tuple((p, BREAK_SECTION) for p in self.section_patterns + self.section_keyword_patterns)
+            + tuple((p, BREAK_TABLE) for p in self.table_patterns)
+            + tuple((p, BREAK_FORMULA) for p in self.formula_patterns)
+        )
+        if compiled is None:
+            return None
+        db, kinds = compiled
+        
+        scratches = getattr(_hs_local, "scratches", None)
+        if scratches is None:
+            scratches = _hs_local.scratches = {}
+        scratch = scratches.get(id(db))
+        if scratch is None:
+            scratch = scratches[id(db)] = hyperscan.Scratch(db)
+        
+        positions: Set[int] = set()
+        
+        def on_match(expression_id: int, start: int, end: int, flags: int, context: Any) -> None:
             # Only add table breaks if they're significant in length
-            if match.end() - match.start() > 20:
-                break_positions.append(match.start())
+            if kinds[expression_id] != BREAK_TABLE or end - start > 20:
+                positions.add(start)
         
-        # Add breaks for formulas
-        formula_matches = list(self.formula_regex.finditer(text))
-        break_positions.extend([m.start() for m in formula_matches])
+        db.scan(text.encode("ascii"), match_event_handler=on_match, scratch=scratch)
+        positions.add(0)
+        return sorted(positions)
+    
+    def _find_semantic_breaks(self, text: str) -> List[int]:
+        """Find positions of semantic breaks in the text."""
+        # All three pattern classes in one Hyperscan pass when enabled and available
+        break_positions = self._hyperscan_breaks(text)
+        if break_positions is not None:
+            return break_positions
         
-        # Always include the start of the document
-        if 0 not in break_positions:
-            break_positions.insert(0, 0)
-            
-        # Sort positions (should already be in order, but just to be safe)
-        break_positions.sort()
+        # Collect into a set (always including the start of the document), so
+        # duplicate positions are dropped before sorting
+        positions: Set[int] = {0}
         
-        return break_positions
+        # One pass over sections, tables and formulas
+        for match in self.break_regex.finditer(text):
+            # Only add table breaks if they're significant in length
+            if match.lastgroup != "table" or match.end() - match.start() > 20:
+                positions.add(match.start())
+        
+        if AHOCORASICK_AVAILABLE:
+            # Section keywords in one automaton pass; like their regex (\n\s*Keyword), a
+            # keyword breaks at the first line break of the whitespace run before it
+            for end, length in self._section_automaton.iter(text):
+                start = end - length + 1
+                run_start = start
+                while run_start > 0 and text[run_start - 1].isspace():
+                    run_start -= 1
+                newline = text.find('\n', run_start, start)
+                if newline != -1:
+                    positions.add(newline)
+        
+        return sorted(positions)
     
-    def _create_chunks_from_breaks(self, text: str, break_positions: List[int]) -> List[str]:
-        """Create chunks from text using semantic break positions."""
-        chunks = []
-        
+    def _create_chunks_from_breaks(self, text: str, break_positions: List[int]) -> Iterator[Tuple[str, Optional[float]]]:
+        """Lazily yield (chunk, density) pairs from text using semantic break positions."""
         for i in range(len(break_positions)):
             start_pos = break_positions[i]
             
@@ -138,15 +317,12 @@ class DocumentChunker:
                 continue
                 
             # If chunk is too large, split it further
-            chunk_tokens = self._estimate_tokens(chunk_text)
-            if chunk_tokens > self.chunk_size * 1.5:
+            if len(chunk_text) > self._max_chunk_chars:
                 # Content is too large for a single chunk
-                sub_chunks = self._split_large_chunk(chunk_text)
-                chunks.extend(sub_chunks)
+                yield from self._split_large_chunk(chunk_text)
             else:
-                chunks.append(chunk_text)
-                
-        return chunks
+                # Density not computed on this path
+                yield chunk_text, None
     
     def _calculate_content_density(self, text: str) -> float:
         """Calculate the information density of a text segment."""
@@ -154,17 +330,27 @@ class DocumentChunker:
             return 0.0
             
         # Count "information-rich" characters
-        special_chars = sum(1 for c in text if c in '0123456789$%.,;:()[]{}')
+        if NUMBA_AVAILABLE:
+            buf = np.frombuffer(text.encode('utf-8', errors='ignore'), dtype=np.uint8)
+            special_chars = _count_flagged_bytes(buf, self._special_lut)
+        elif text.isascii():
+            special_chars = len(text) - len(text.translate(self._special_chars_delete))
+        else:
+            buf = np.frombuffer(text.encode('utf-8', errors='ignore'), dtype=np.uint8)
+            special_chars = int(np.count_nonzero(self._special_lut[buf]))
         numeric_density = special_chars / len(text)
         
-        # Count structure indicators
-        bullet_points = len(re.findall(r'[•\*\-]\s+', text))
-        headings = len(re.findall(r'#+\s+|\n[A-Z][A-Z\s]+[:\n]', text))
-        table_rows = len(re.findall(r'\|\s*[\w\s]+\s*\|', text))
+        # Count structure indicators in a single pass
+        counts = Counter(m.lastgroup for m in self._density_re.finditer(text))
+        bullet_points = counts["bullet"]
+        headings = counts["heading"]
+        table_rows = counts["table_row"]
         
         # Count key business terms (commonly found in compensation plans)
-        business_terms = len(re.findall(r'quota|bonus|commission|revenue|sales|target|goal|payout|incentive', 
-                                         text, re.IGNORECASE))
+        if AHOCORASICK_AVAILABLE:
+            business_terms = sum(1 for _ in self._business_terms_automaton.iter(text.lower()))
+        else:
+            business_terms = len(self._business_terms_re.findall(text))
         
         # Weight the indicators (adjust these weights based on testing)
         structure_score = (bullet_points * 0.01 + headings * 0.05 + table_rows * 0.05)
@@ -175,98 +361,115 @@ class DocumentChunker:
         
         return density
     
-    def _split_large_chunk(self, text: str) -> List[str]:
-        """Split an oversized chunk into smaller chunks based on content density."""
-        # First try to split by paragraphs
-        paragraphs = re.split(r'\n\s*\n', text)
+    def _iter_paragraphs(self, text: str) -> Iterator[str]:
+        """Yield paragraphs one at a time instead of materializing the full split list."""
+        prev = 0
+        for match in self._para_split_re.finditer(text):
+            yield text[prev:match.start()]
+            prev = match.end()
+        yield text[prev:]
+    
+    @staticmethod
+    def _mean_density(weighted_density: float, chars: int) -> float:
+        """Character-weighted mean of paragraph densities accumulated for a chunk."""
+        return weighted_density / chars if chars else 0.0
+    
+    def _split_large_chunk(self, text: str) -> List[Tuple[str, Optional[float]]]:
+        """
+        Split an oversized chunk into smaller chunks based on content density.
         
-        if len(paragraphs) > 1:
+        Returns (chunk, density) pairs; the density is the character-weighted mean of the
+        paragraph densities already computed for sizing, or None where none was computed.
+        """
+        # First try to split by paragraphs
+        if self._para_split_re.search(text):
             # We have multiple paragraphs, process them adaptively
-            result = []
-            current_chunk = ""
-            current_tokens = 0
+            result: List[Tuple[str, Optional[float]]] = []
+            current_parts: List[str] = []
+            current_weighted = 0.0
+            current_chars = 0
             
-            for para in paragraphs:
+            for para in self._iter_paragraphs(text):
                 para = para.strip()
                 if not para:
                     continue
                     
                 # Calculate density to determine target size
                 density = self._calculate_content_density(para)
-                para_tokens = self._estimate_tokens(para)
+                para_chars = len(para)
                 
                 # Adjust target size based on density - denser content gets smaller chunks
                 density_factor = 1.0 - (density * 0.5)  # 0.5 to 1.0 depending on density
-                target_size = int(self.chunk_size * density_factor)
+                target_chars = int(self._chunk_chars * density_factor)
                 
-                # Dense paragraphs get their own chunks
-                if density > 0.15 and para_tokens > 100:
+                # Dense paragraphs (over ~100 tokens) get their own chunks
+                if density > 0.15 and para_chars > 100 * self.avg_chars_per_token:
                     # If we have a current chunk, add it to results
-                    if current_chunk:
-                        result.append(current_chunk)
-                        current_chunk = ""
-                        current_tokens = 0
+                    if current_parts:
+                        result.append(("\n\n".join(current_parts), self._mean_density(current_weighted, current_chars)))
+                        current_parts = []
+                        current_weighted = 0.0
+                        current_chars = 0
                     
                     # Put the dense paragraph in its own chunk
-                    result.append(para)
+                    result.append((para, density))
                     continue
                 
                 # If adding this paragraph would make the chunk too large, start a new chunk
-                if current_tokens + para_tokens > target_size and current_chunk:
-                    result.append(current_chunk)
-                    current_chunk = para
-                    current_tokens = para_tokens
+                if current_chars + para_chars > target_chars and current_parts:
+                    result.append(("\n\n".join(current_parts), self._mean_density(current_weighted, current_chars)))
+                    current_parts = [para]
+                    current_weighted = density * para_chars
+                    current_chars = para_chars
                 else:
-                    if current_chunk:
-                        current_chunk += "\n\n" + para
-                    else:
-                        current_chunk = para
-                    current_tokens += para_tokens
+                    if current_parts:
+                        current_chars += 2
+                    current_parts.append(para)
+                    current_weighted += density * para_chars
+                    current_chars += para_chars
             
             # Add the last chunk if not empty
-            if current_chunk:
-                result.append(current_chunk)
+            if current_parts:
+                result.append(("\n\n".join(current_parts), self._mean_density(current_weighted, current_chars)))
                 
             return result
         else:
             # No paragraph breaks, fall back to sentence splitting
-            return self._split_by_sentences(text)
+            return [(chunk, None) for chunk in self._split_by_sentences(text)]
     
     def _split_by_sentences(self, text: str) -> List[str]:
         """Split text by sentences when no paragraph breaks are available."""
         # More sophisticated sentence detection
-        sentence_endings = r'(?<=[.!?])\s+(?=[A-Z])'
-        sentences = re.split(sentence_endings, text)
+        sentences = self._sentence_split_re.split(text)
         
-        result = []
-        current_chunk = ""
-        current_tokens = 0
+        result: List[str] = []
+        current_parts: List[str] = []
+        current_chars = 0
         
         for sentence in sentences:
             sentence = sentence.strip()
             if not sentence:
                 continue
                 
-            sentence_tokens = self._estimate_tokens(sentence)
+            sentence_chars = len(sentence)
             
             # If adding this sentence would make the chunk too large, start a new chunk
-            if current_tokens + sentence_tokens > self.chunk_size and current_chunk:
-                result.append(current_chunk)
-                current_chunk = sentence
-                current_tokens = sentence_tokens
+            if current_chars + sentence_chars > self._chunk_chars and current_parts:
+                result.append(" ".join(current_parts))
+                current_parts = [sentence]
+                current_chars = sentence_chars
             else:
-                if current_chunk:
-                    current_chunk += " " + sentence
-                else:
-                    current_chunk = sentence
-                current_tokens += sentence_tokens
+                if current_parts:
+                    current_chars += 1
+                current_parts.append(sentence)
+                current_chars += sentence_chars
         
         # Add the last chunk if not empty
-        if current_chunk:
-            result.append(current_chunk)
+        if current_parts:
+            result.append(" ".join(current_parts))
             
         # If we still have very large chunks, use fixed size chunking as a fallback
-        if not result or any(self._estimate_tokens(chunk) > self.chunk_size * 1.5 for chunk in result):
+        if not result or any(len(chunk) > self._max_chunk_chars for chunk in result):
             return self._fixed_size_chunks(text)
         
         return result
@@ -276,7 +479,16 @@ class DocumentChunker:
         target_chars = self.chunk_size * self.avg_chars_per_token
         overlap_chars = self.chunk_overlap * self.avg_chars_per_token
         
-        chunks = []
+        # Find every ". " and space position in one vectorized pass over the code points
+        # (code point offsets equal str offsets), then look boundaries up by binary search
+        if text.isascii():
+            codes = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+        else:
+            codes = np.frombuffer(text.encode('utf-32-le', errors='surrogatepass'), dtype=np.uint32)
+        spaces = np.flatnonzero(codes == 0x20)
+        sentence_ends = spaces[(spaces > 0) & (codes[spaces - 1] == 0x2E)] - 1
+        
+        chunks: List[str] = []
         start = 0
         
         while start < len(text):
@@ -285,13 +497,16 @@ class DocumentChunker:
             if end >= len(text):
                 end = len(text)
             else:
-                # Try to break at a sentence or period to avoid cutting mid-sentence
-                sentence_end = text.rfind('. ', start, end)
+                # Try to break at a sentence or period to avoid cutting mid-sentence:
+                # the last ". " ending within [start, end)
+                idx = np.searchsorted(sentence_ends, end - 1) - 1
+                sentence_end = int(sentence_ends[idx]) if idx >= 0 else -1
                 if sentence_end > start + (target_chars // 2):
                     end = sentence_end + 1  # Include the period
                 else:
-                    # Fall back to breaking at a space
-                    space = text.rfind(' ', start, end)
+                    # Fall back to breaking at the last space before end
+                    idx = np.searchsorted(spaces, end) - 1
+                    space = int(spaces[idx]) if idx >= 0 else -1
                     if space > start + (target_chars // 3):
                         end = space
             
@@ -309,24 +524,30 @@ class DocumentChunker:
                 
         return chunks
     
-    def _create_intelligent_chunks(self, text: str) -> List[str]:
-        """Create intelligent chunks based on document structure and content density."""
+    def _create_intelligent_chunks(self, text: str) -> Iterator[Tuple[str, Optional[float]]]:
+        """
+        Create intelligent chunks based on document structure and content density.
+        
+        Chunks are yielded one at a time, so callers that stop early skip the rest of the work.
+        
+        Returns:
+            Iterator of (chunk, density) pairs; density is None where it was not computed during chunking
+        """
         # Try to find semantic breaks first
         break_positions = self._find_semantic_breaks(text)
         
         # If we found sufficient breaks, use them
         if len(break_positions) > 3:
-            return self._create_chunks_from_breaks(text, break_positions)
+            yield from self._create_chunks_from_breaks(text, break_positions)
+            return
         
         # Otherwise, use content density to create variable-sized chunks
-        chunks = []
-        paragraphs = re.split(r'\n\s*\n', text)
-        
-        current_chunk = ""
-        current_size = 0
+        current_parts: List[str] = []
+        current_weighted = 0.0
+        current_chars = 0
         token_density_threshold = 0.7  # Adjust based on content type
         
-        for para in paragraphs:
+        for para in self._iter_paragraphs(text):
             para = para.strip()
             if not para:
                 continue
@@ -335,33 +556,32 @@ class DocumentChunker:
             density = self._calculate_content_density(para)
             
             # Adjust target size based on density
-            para_target_size = int(self.chunk_size * (1 - density * token_density_threshold))
-            para_tokens = self._estimate_tokens(para)
+            para_target_chars = int(self._chunk_chars * (1 - density * token_density_threshold))
+            para_chars = len(para)
             
             # If adding this paragraph would exceed chunk size or it's high density content
-            if (current_size + para_tokens > para_target_size and current_chunk) or density > 0.2:
+            if (current_chars + para_chars > para_target_chars and current_parts) or density > 0.2:
                 # Save current chunk and start a new one
-                chunks.append(current_chunk)
-                current_chunk = para
-                current_size = para_tokens
+                yield "\n\n".join(current_parts), self._mean_density(current_weighted, current_chars)
+                current_parts = [para]
+                current_weighted = density * para_chars
+                current_chars = para_chars
             else:
                 # Add to current chunk
-                if current_chunk:
-                    current_chunk += "\n\n" + para
-                else:
-                    current_chunk = para
-                current_size += para_tokens
+                if current_parts:
+                    current_chars += 2
+                current_parts.append(para)
+                current_weighted += density * para_chars
+                current_chars += para_chars
         
         # Add the last chunk
-        if current_chunk:
-            chunks.append(current_chunk)
-            
-        return chunks
+        if current_parts:
+            yield "\n\n".join(current_parts), self._mean_density(current_weighted, current_chars)
         
     def create_chunks(self, 
                      document_id: str,
                      content: str, 
-                     metadata: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+                     metadata: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Create semantic chunks from document content.
         
@@ -373,19 +593,20 @@ class DocumentChunker:
         Returns:
             List of chunk dictionaries with text and metadata
         """
-        # Use intelligent chunking strategy
-        initial_chunks = self._create_intelligent_chunks(content)
+        # Use intelligent chunking strategy, stopping one past the limit so the
+        # tail of an oversized document is never chunked
+        initial_chunks = list(itertools.islice(self._create_intelligent_chunks(content), self.max_chunks_per_doc + 1))
         
         # Limit number of chunks if needed
         if len(initial_chunks) > self.max_chunks_per_doc:
-            logger.warning(f"Document {document_id} has {len(initial_chunks)} chunks, limiting to {self.max_chunks_per_doc}")
+            logger.warning(f"Document {document_id} has more than {self.max_chunks_per_doc} chunks, limiting to {self.max_chunks_per_doc}")
             initial_chunks = initial_chunks[:self.max_chunks_per_doc]
         
         # Create chunk objects with metadata
         doc_metadata = metadata or {}
         
-        chunk_objects = []
-        for i, chunk_text in enumerate(initial_chunks):
+        chunk_objects: List[Dict[str, Any]] = []
+        for i, (chunk_text, density) in enumerate(initial_chunks):
             # Prepare chunk metadata
             chunk_metadata = doc_metadata.copy()
             chunk_metadata.update({
@@ -394,10 +615,13 @@ class DocumentChunker:
                 "chunk_index": i,
                 "total_chunks": len(initial_chunks),
                 "tokens": self._estimate_tokens(chunk_text),
-                "density": self._calculate_content_density(chunk_text),
                 "chunk_type": "semantic"
             })
             
+            # Density only on request; reuse the one computed while chunking where there is one
+            if self.include_density:
+                chunk_metadata["density"] = density if density is not None else self._calculate_content_density(chunk_text)
+            
             # Add position info (start/middle/end)
             if i == 0:
                 chunk_metadata["position"] = "start"
@@ -416,7 +640,7 @@ class DocumentChunker:
     
     def chunk_document_from_file(self, 
                                 document_path: Path,
-                                document_id: str = None) -> List[Dict[str, Any]]:
+                                document_id: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         Load document from file and create chunks.
         
@@ -432,25 +656,37 @@ class DocumentChunker:
             if not document_id:
                 document_id = document_path.stem
             
-            # Load document content
-            with open(document_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            # Load document content: map the file and decode it once instead of a buffered text read
+            with open(document_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        raw = mm[:]
+                else:
+                    raw = b''
                 
-            # Extract metadata if JSON
-            metadata = {}
-            if document_path.suffix == '.json':
+            # Extract metadata if JSON (only an object can carry 'content', so skip parsing otherwise);
+            # the raw bytes are parsed directly, without decoding the file first
+            content: Optional[str] = None
+            metadata: Dict[str, Any] = {}
+            if document_path.suffix == '.json' and raw[:64].lstrip()[:1] == b'{':
                 try:
-                    data = json.loads(content)
+                    data = _json_loads(raw)
                     if isinstance(data, dict) and 'content' in data:
                         metadata = {k: v for k, v in data.items() if k != 'content'}
                         content = data['content']
-                except json.JSONDecodeError:
+                except ValueError as e:
                     # If failed to parse as JSON, treat as plain text
                     logger.warning(f"⚠️ Failed to parse JSON: {str(e)} — treating as plain text")
                 except Exception as e:
                     # Other errors
                     logger.warning(f"⚠️ Error processing JSON: {str(e)}")
             
+            if content is None:
+                content = raw.decode('utf-8', errors='replace')
+                if '\r' in content:
+                    # Match the newline translation of text-mode reads
+                    content = content.replace('\r\n', '\n').replace('\r', '\n')
+            
             # Add file metadata
             metadata.update({
                 "filename": document_path.name,
@@ -464,4 +700,42 @@ class DocumentChunker:
             
         except Exception as e:
             logger.error(f"❌ Failed to chunk document {document_path}: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def chunk_documents(self,
+                        document_paths: List[Path],
+                        workers: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Chunk many documents in parallel worker processes.
+        
+        Chunking is CPU-bound regex work and documents are independent, so each
+        worker process chunks its own files. The chunker is pickled to the workers.
+        
+        Args:
+            document_paths: Paths to document files
+            workers: Number of worker processes (defaults to the CPU count)
+            
+        Returns:
+            Iterator of chunk lists, in the same order as document_paths
+        """
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            yield from executor.map(self.chunk_document_from_file, document_paths, chunksize=8)
+
+
+@functools.lru_cache(maxsize=16)
+def get_chunker(chunk_size: int = 512,
+                chunk_overlap: int = 50,
+                max_chunks_per_doc: int = 100,
+                include_density: bool = False,
+                use_hyperscan: bool = False) -> DocumentChunker:
+    """
+    Return a shared DocumentChunker for this configuration.
+    
+    Chunkers hold only configuration, so one instance per configuration is reused
+    instead of being rebuilt by every caller.
+    """
+    return DocumentChunker(chunk_size=chunk_size,
+                           chunk_overlap=chunk_overlap,
+                           max_chunks_per_doc=max_chunks_per_doc,
+                           include_density=include_density,
+                           use_hyperscan=use_hyperscan)
@@ -8,16 +8,27 @@ Embedding Generator - Creates vector embeddings for document chunks.
 
 import os
 import json
-import time
+import fcntl
 import logging
 import hashlib
+import sqlite3
+import threading
 import numpy as np
+import openai
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Optional, Union
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+# Import xxhash conditionally; cache keys fall back to BLAKE2b without it
+try:
+    import xxhash
+    XXHASH_AVAILABLE = True
+except ImportError:
+    XXHASH_AVAILABLE = False
 
 from config.config import config
-from src.utils.openai_client import OpenAIProcessor
+from src.utils.openai_client import OpenAIProcessor, exponential_backoff_retry
 
 # Configure logging
 logger = logging.getLogger("embedding_generator")
@@ -54,11 +65,16 @@ class EmbeddingGenerator:
         }
     }
     
+    # Bound on SQLite host parameters per statement (SQLITE_MAX_VARIABLE_NUMBER
+    # on builds before 3.32)
+    SQLITE_MAX_PARAMS = 999
+    
     def __init__(self, 
                  model_name: str = "openai",
                  cache_dir: Optional[str] = None,
                  use_cache: bool = True,
-                 batch_size: int = 20):
+                 batch_size: int = 20,
+                 max_in_flight: int = 8):
         """
         Initialize embedding generator with model settings.
         
@@ -67,6 +83,7 @@ class EmbeddingGenerator:
             cache_dir: Directory to store embedding cache
             use_cache: Whether to use embedding caching
             batch_size: Number of texts to embed in one batch
+            max_in_flight: Maximum number of OpenAI batch requests sent concurrently
         """
         self.model_name = model_name
         
@@ -80,11 +97,18 @@ class EmbeddingGenerator:
         self.max_tokens = self.model_config["max_tokens"]
         self.use_cache = use_cache
         self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        
+        # Optional shared cache (e.g. a database table) consulted after the local
+        # cache; see set_shared_cache
+        self.shared_cache_lookup = None
+        self.shared_cache_store = None
         
         # Initialize cache
         if use_cache:
             self.cache_dir = Path(cache_dir) if cache_dir else Path(config.DATA_DIR) / "embeddings_cache"
             self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._init_vector_cache()
             logger.info(f"Embeddings cache directory: {self.cache_dir}")
         
         # Initialize API clients
@@ -113,47 +137,183 @@ class EmbeddingGenerator:
             logger.error("SentenceTransformer not installed. Install with: pip install sentence-transformers")
             raise
     
-    def _get_cache_key(self, text: str) -> str:
-        """Generate a cache key for a text by hashing its content."""
+    def set_shared_cache(self, lookup, store):
+        """
+        Register a shared embedding cache keyed by (sha256(text), provider, model).
+        
+        Args:
+            lookup: Callable(hashes, provider, model) -> {hash: embedding}
+            store: Callable([(hash, embedding)], provider, model)
+        """
+        self.shared_cache_lookup = lookup
+        self.shared_cache_store = store
+    
+    @property
+    def provider(self) -> str:
+        """Embedding provider name (openai, huggingface)."""
+        return self.model_name.split("-")[0]
+    
+    @staticmethod
+    def content_hash(text: str) -> str:
+        """Content hash used as the shared cache key."""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def _get_cache_key(self, text: str) -> bytes:
+        """Generate a 16-byte cache key for a text by hashing its content."""
+        if XXHASH_AVAILABLE:
+            return xxhash.xxh3_128_digest(text.encode('utf-8'))
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+    
+    @staticmethod
+    def _get_legacy_cache_key(text: str) -> str:
+        """MD5 hex key used by caches written before keys became raw digests."""
         return hashlib.md5(text.encode('utf-8')).hexdigest()
     
+    def _init_vector_cache(self):
+        """
+        Open this model's embedding cache: an append-only file of float32 rows
+        (dimensions wide) plus a SQLite index mapping cache key -> row.
+        """
+        self._cache_lock = threading.Lock()
+        self._row_bytes = self.dimensions * np.dtype(np.float32).itemsize
+        self._vector_path = self.cache_dir / f"{self.model_name}.f32"
+        self._vector_file = open(self._vector_path, 'ab')
+        self._vectors = None  # Read-only memmap of the rows, remapped as the file grows
+        
+        self._index = sqlite3.connect(str(self.cache_dir / f"{self.model_name}.idx"), check_same_thread=False)
+        self._index.execute("CREATE TABLE IF NOT EXISTS kv (k BLOB PRIMARY KEY, row INTEGER NOT NULL)")
+        self._index.commit()
+        
+        if self._index.execute("SELECT 1 FROM kv LIMIT 1").fetchone() is None:
+            self._migrate_json_cache()
+        
+        # Fall back to MD5 keys on a miss while any are left to re-key
+        self.legacy_cache_keys = self._index.execute(
+            "SELECT 1 FROM kv WHERE typeof(k) = 'text' LIMIT 1"
+        ).fetchone() is not None
+    
     def _get_cache_path(self, cache_key: str) -> Path:
-        """Get the file path for a cached embedding."""
+        """Get the file path of an embedding in the legacy one-JSON-file-per-embedding cache."""
         return self.cache_dir / f"{cache_key}_{self.model_name}.json"
     
-    def _load_from_cache(self, cache_key: str) -> Optional[List[float]]:
-        """Load embedding from cache if available."""
-        if not self.use_cache:
-            return None
-            
-        cache_path = self._get_cache_path(cache_key)
-        
-        if cache_path.exists():
+    def _migrate_json_cache(self):
+        """Import embeddings from the legacy JSON file cache into the vector cache (once)."""
+        suffix = f"_{self.model_name}.json"
+        entries = []
+        for path in self.cache_dir.glob(f"*{suffix}"):
             try:
-                with open(cache_path, 'r') as f:
-                    cached_data = json.load(f)
-                    # Verify dimensions match current model
-                    if len(cached_data) == self.dimensions:
-                        logger.debug(f"Cache hit for {cache_key}")
-                        return cached_data
-                    else:
-                        logger.debug(f"Cache dimensions mismatch: {len(cached_data)} vs {self.dimensions}")
-                        return None
+                with open(path, 'r') as f:
+                    entries.append((path.name[:-len(suffix)], json.load(f)))
             except Exception as e:
-                logger.warning(f"Failed to load from cache: {e}")
-                return None
-        return None
+                logger.warning(f"Skipping unreadable cache file {path.name}: {e}")
+        
+        if entries:
+            self._save_many_to_cache(entries)
+            logger.info(f"Migrated {len(entries)} cached embeddings into {self._vector_path.name}")
     
-    def _save_to_cache(self, cache_key: str, embedding: List[float]):
+    def _read_rows(self, rows: List[int]) -> np.ndarray:
+        """Vectors stored at the given rows (call with _cache_lock held)."""
+        needed = max(rows) + 1
+        if self._vectors is None or len(self._vectors) < needed:
+            # Rows were appended since the file was mapped (possibly by another process)
+            count = self._vector_path.stat().st_size // self._row_bytes
+            self._vectors = np.memmap(self._vector_path, dtype=np.float32, mode='r',
+                                      shape=(count, self.dimensions))
+        return self._vectors[rows]
+    
+    def _lookup_rows(self, keys: List[Union[bytes, str]]) -> Dict[Union[bytes, str], int]:
+        """Index rows of the keys present in the cache (call with _cache_lock held)."""
+        rows = {}
+        for start in range(0, len(keys), self.SQLITE_MAX_PARAMS):
+            chunk = keys[start:start + self.SQLITE_MAX_PARAMS]
+            placeholders = ','.join('?' * len(chunk))
+            rows.update(self._index.execute(f"SELECT k, row FROM kv WHERE k IN ({placeholders})", chunk))
+        return rows
+    
+    def _load_many_from_cache(self, cache_keys: List[bytes],
+                              texts: Optional[List[str]] = None) -> Dict[int, List[float]]:
+        """
+        Look up many embeddings with one index query and one gather from the vector file.
+        
+        When legacy_cache_keys is set and texts are given, misses are retried under
+        the texts' MD5 keys and hits there are re-keyed to the new keys.
+        
+        Returns:
+            Cached embeddings keyed by position in cache_keys
+        """
+        if not self.use_cache or not cache_keys:
+            return {}
+        
+        try:
+            with self._cache_lock:
+                rows = self._lookup_rows(list(set(cache_keys)))
+                
+                if self.legacy_cache_keys and texts is not None:
+                    missing = {key: self._get_legacy_cache_key(text)
+                               for key, text in zip(cache_keys, texts) if key not in rows}
+                    legacy_rows = self._lookup_rows(list(set(missing.values())))
+                    rekeyed = [(key, legacy_rows[legacy_key]) for key, legacy_key in missing.items()
+                               if legacy_key in legacy_rows]
+                    if rekeyed:
+                        with self._index:
+                            self._index.executemany("INSERT OR REPLACE INTO kv (k, row) VALUES (?, ?)", rekeyed)
+                            self._index.executemany("DELETE FROM kv WHERE k = ?",
+                                                    [(missing[key],) for key, _ in rekeyed])
+                        rows.update(rekeyed)
+                
+                hit_positions = [i for i, key in enumerate(cache_keys) if key in rows]
+                if not hit_positions:
+                    return {}
+                vectors = self._read_rows([rows[cache_keys[i]] for i in hit_positions])
+            
+            logger.debug(f"Cache hits: {len(hit_positions)}/{len(cache_keys)}")
+            return dict(zip(hit_positions, vectors.tolist()))
+        except Exception as e:
+            logger.warning(f"Failed to load from cache: {e}")
+            return {}
+    
+    def _load_from_cache(self, cache_key: bytes, text: Optional[str] = None) -> Optional[List[float]]:
+        """Load embedding from cache if available."""
+        return self._load_many_from_cache([cache_key], None if text is None else [text]).get(0)
+    
+    def _save_to_cache(self, cache_key: bytes, embedding: List[float]):
         """Save embedding to cache."""
+        self._save_many_to_cache([(cache_key, embedding)])
+    
+    def _save_many_to_cache(self, entries: List[Tuple[Union[bytes, str], List[float]]]):
+        """Append embeddings to the vector file and index them in one transaction."""
         if not self.use_cache:
             return
-            
-        cache_path = self._get_cache_path(cache_key)
+        
+        # Rows are fixed-width, so only embeddings of this model's dimensions are stored;
+        # zero-vector fallbacks from failed calls are not cached either
+        entries = [(key, embedding) for key, embedding in entries
+                   if len(embedding) == self.dimensions and any(embedding)]
+        if not entries:
+            return
         
         try:
-            with open(cache_path, 'w') as f:
-                json.dump(embedding, f)
+            data = np.asarray([embedding for _, embedding in entries], dtype=np.float32).tobytes()
+            with self._cache_lock:
+                # Exclusive file lock so concurrent processes never interleave rows
+                fcntl.flock(self._vector_file, fcntl.LOCK_EX)
+                try:
+                    size = self._vector_file.seek(0, os.SEEK_END)
+                    if size % self._row_bytes:
+                        # Drop a partial row left by an interrupted write
+                        size -= size % self._row_bytes
+                        self._vector_file.truncate(size)
+                    self._vector_file.write(data)
+                    self._vector_file.flush()
+                finally:
+                    fcntl.flock(self._vector_file, fcntl.LOCK_UN)
+                
+                first_row = size // self._row_bytes
+                with self._index:
+                    self._index.executemany(
+                        "INSERT OR REPLACE INTO kv (k, row) VALUES (?, ?)",
+                        [(key, first_row + i) for i, (key, _) in enumerate(entries)]
+                    )
         except Exception as e:
             logger.warning(f"Failed to save to cache: {e}")
     
@@ -169,6 +329,9 @@ class EmbeddingGenerator:
             )
             embedding = response.data[0].embedding
             return embedding
+        except openai.RateLimitError:
+            # Surface rate limits rather than caching a zero vector
+            raise
         except Exception as e:
             logger.error(f"OpenAI embedding error: {e}")
             # Return a zero vector as fallback
@@ -187,6 +350,15 @@ class EmbeddingGenerator:
             # Return a zero vector as fallback
             return [0.0] * self.dimensions
     
+    @exponential_backoff_retry(max_retries=5, initial_delay=1, retryable_exceptions=(openai.RateLimitError,))
+    def _embed_openai_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed one batch of texts with the OpenAI API, backing off on rate limits."""
+        response = self.openai_client.client.embeddings.create(
+            model=self.model_config["model_name"],
+            input=batch
+        )
+        return [item.embedding for item in response.data]
+    
     def generate_embedding(self, text: str) -> List[float]:
         """
         Generate an embedding for a single text.
@@ -199,7 +371,7 @@ class EmbeddingGenerator:
         """
         # Check if embedding is in cache
         cache_key = self._get_cache_key(text)
-        cached_embedding = self._load_from_cache(cache_key)
+        cached_embedding = self._load_from_cache(cache_key, text)
         
         if cached_embedding is not None:
             return cached_embedding
@@ -227,21 +399,29 @@ class EmbeddingGenerator:
         Returns:
             List of embedding vectors
         """
-        # Check which texts need embedding (not in cache)
-        cache_hits = {}
-        texts_to_embed = []
-        text_indices = []
-        
-        # Check cache first
-        for i, text in enumerate(texts):
-            cache_key = self._get_cache_key(text)
-            cached_embedding = self._load_from_cache(cache_key)
+        # Check which texts need embedding (not in cache), with one bulk lookup
+        cache_keys = [self._get_cache_key(text) for text in texts]
+        cache_hits = self._load_many_from_cache(cache_keys, texts)
+        text_indices = [i for i in range(len(texts)) if i not in cache_hits]
+        texts_to_embed = [texts[i] for i in text_indices]
+        
+        # Consult the shared cache for local misses
+        if texts_to_embed and self.shared_cache_lookup:
+            shared_keys = [self.content_hash(text) for text in texts_to_embed]
+            shared_hits = self.shared_cache_lookup(shared_keys, self.provider, self.model_config["model_name"])
             
-            if cached_embedding is not None:
-                cache_hits[i] = cached_embedding
-            else:
-                texts_to_embed.append(text)
-                text_indices.append(i)
+            if shared_hits:
+                remaining_texts, remaining_indices, local_entries = [], [], []
+                for text, i, key in zip(texts_to_embed, text_indices, shared_keys):
+                    embedding = shared_hits.get(key)
+                    if embedding is not None and len(embedding) == self.dimensions:
+                        cache_hits[i] = embedding
+                        local_entries.append((cache_keys[i], embedding))
+                    else:
+                        remaining_texts.append(text)
+                        remaining_indices.append(i)
+                self._save_many_to_cache(local_entries)
+                texts_to_embed, text_indices = remaining_texts, remaining_indices
         
         logger.info(f"Cache hits: {len(cache_hits)}/{len(texts)} texts")
         
@@ -254,51 +434,55 @@ class EmbeddingGenerator:
         if self.model_name.startswith("openai"):
             # Use OpenAI's batch API
             try:
-                # Process in smaller batches to avoid rate limits
+                # Send up to max_in_flight batches at once; map keeps results in order
+                batches = [texts_to_embed[i:i + self.batch_size]
+                           for i in range(0, len(texts_to_embed), self.batch_size)]
                 all_embeddings = []
                 
-                for i in range(0, len(texts_to_embed), self.batch_size):
-                    batch = texts_to_embed[i:i + self.batch_size]
-                    response = self.openai_client.client.embeddings.create(
-                        model=self.model_config["model_name"],
-                        input=batch
-                    )
-                    batch_embeddings = [item.embedding for item in response.data]
-                    all_embeddings.extend(batch_embeddings)
-                    
-                    # Rate limit handling
-                    if len(texts_to_embed) > self.batch_size and i + self.batch_size < len(texts_to_embed):
-                        time.sleep(0.5)  # Add delay between batches
+                with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(batches))) as executor:
+                    for batch_embeddings in executor.map(self._embed_openai_batch, batches):
+                        all_embeddings.extend(batch_embeddings)
                     
+            except openai.RateLimitError:
+                # Still rate limited after backing off; per-text calls would only add load
+                raise
             except Exception as e:
                 logger.error(f"OpenAI batch embedding error: {e}")
-                # Fallback to individual embedding
+                # Fallback to individual embedding (uncached calls: these texts
+                # already missed, and the bulk save below caches the results)
                 logger.info("Falling back to individual embedding")
-                all_embeddings = []
-                for text in texts_to_embed:
-                    embedding = self.generate_embedding(text)
-                    all_embeddings.append(embedding)
+                all_embeddings = [self.generate_openai_embedding(text) for text in texts_to_embed]
                 
         elif self.model_name.startswith("huggingface"):
-            # Use HuggingFace batch encoding
+            # Use HuggingFace batch encoding, length-sorted so each mini-batch
+            # pads to similar lengths; results are put back in input order
             try:
-                batch_embeddings = self.hf_model.encode(texts_to_embed)
-                all_embeddings = batch_embeddings.tolist()
+                order = np.argsort([len(text) for text in texts_to_embed], kind='stable')
+                batch_embeddings = self.hf_model.encode(
+                    [texts_to_embed[i] for i in order],
+                    batch_size=1024,
+                    show_progress_bar=False,
+                    convert_to_numpy=True
+                )
+                all_embeddings = batch_embeddings[np.argsort(order)].tolist()
             except Exception as e:
                 logger.error(f"HuggingFace batch embedding error: {e}")
-                # Fallback to individual embedding
-                all_embeddings = []
-                for text in texts_to_embed:
-                    embedding = self.generate_embedding(text)
-                    all_embeddings.append(embedding)
+                # Fallback to individual embedding (uncached, as above)
+                all_embeddings = [self.generate_huggingface_embedding(text) for text in texts_to_embed]
                     
         else:
             raise ValueError(f"Unsupported embedding model: {self.model_name}")
         
-        # Save to cache
-        for i, embedding in enumerate(all_embeddings):
-            cache_key = self._get_cache_key(texts_to_embed[i])
-            self._save_to_cache(cache_key, embedding)
+        # Save to cache in one append and one index transaction
+        self._save_many_to_cache([(cache_keys[i], embedding)
+                                  for i, embedding in zip(text_indices, all_embeddings)])
+        
+        # Share new embeddings (skipping zero-vector fallbacks from failed calls)
+        if self.shared_cache_store:
+            entries = [(self.content_hash(text), embedding)
+                       for text, embedding in zip(texts_to_embed, all_embeddings) if any(embedding)]
+            if entries:
+                self.shared_cache_store(entries, self.provider, self.model_config["model_name"])
         
         # Merge cache hits and new embeddings
         result = [None] * len(texts)
@@ -352,26 +536,16 @@ class EmbeddingGenerator:
             return {"enabled": False}
             
         try:
-            cache_files = list(self.cache_dir.glob(f"*_{self.model_name}.json"))
-            
-            # Sample some embeddings to verify dimensions
-            dimensions = []
-            if cache_files:
-                for file in cache_files[:5]:
-                    try:
-                        with open(file, 'r') as f:
-                            embedding = json.load(f)
-                            dimensions.append(len(embedding))
-                    except:
-                        pass
+            with self._cache_lock:
+                cache_size = self._index.execute("SELECT COUNT(*) FROM kv").fetchone()[0]
             
             return {
                 "enabled": True,
                 "model": self.model_name,
                 "cache_dir": str(self.cache_dir),
-                "cache_size": len(cache_files),
+                "cache_size": cache_size,
                 "dimensions": self.dimensions,
-                "sampled_dimensions": dimensions
+                "cache_bytes": self._vector_path.stat().st_size
             }
         except Exception as e:
             logger.error(f"Error getting cache stats: {e}")
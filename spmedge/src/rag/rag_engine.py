@@ -13,12 +13,14 @@ import re
 import json
 import logging
 import time
+import threading
+import openai
 from pathlib import Path
 from typing import List, Dict, Any, Tuple, Optional, Union, Callable
 
 from config.config import config
 from src.utils.openai_client import OpenAIProcessor
-from src.rag.document_chunker import DocumentChunker
+from src.rag.document_chunker import get_chunker
 from src.rag.embedding_generator import EmbeddingGenerator
 from src.rag.vector_store import VectorStore
 
@@ -35,7 +37,8 @@ class RAGEngine:
                 index_name: str = "spmedge",
                 data_dir: Optional[str] = None,
                 chunk_size: int = 512,
-                chunk_overlap: int = 50):
+                chunk_overlap: int = 50,
+                embedding_batch_size: int = 64):
         """
         Initialize the RAG engine.
         
@@ -46,6 +49,7 @@ class RAGEngine:
             data_dir: Base directory for data storage
             chunk_size: Target size for document chunks
             chunk_overlap: Overlap between chunks
+            embedding_batch_size: Texts sent per embedding API request
         """
         # Set up directories
         self.data_dir = Path(data_dir) if data_dir else Path(config.DATA_DIR) / "rag_data"
@@ -58,7 +62,7 @@ class RAGEngine:
         self.openai_client = OpenAIProcessor()
         
         # Initialize document chunker
-        self.chunker = DocumentChunker(
+        self.chunker = get_chunker(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap
         )
@@ -66,7 +70,8 @@ class RAGEngine:
         # Initialize embedding generator
         self.embedding_generator = EmbeddingGenerator(
             model_name=embedding_model,
-            cache_dir=str(self.data_dir / "embeddings_cache")
+            cache_dir=str(self.data_dir / "embeddings_cache"),
+            batch_size=embedding_batch_size
         )
         
         # Get dimensions from embedding model
@@ -83,6 +88,9 @@ class RAGEngine:
         # Try to load existing index
         self.vector_store.load()
         
+        # Serializes vector store writes when documents are processed concurrently
+        self._store_lock = threading.Lock()
+        
         logger.info(f"RAG Engine initialized with {embedding_model} embeddings ({self.dimensions} dimensions)")
         logger.info(f"Vector store contains {len(self.vector_store.doc_ids)} documents")
     
@@ -104,7 +112,10 @@ class RAGEngine:
             document_metadata: Optional additional metadata
             
         Returns:
-            List of processed chunks
+            List of processed chunks ([] on failure)
+            
+        Raises:
+            openai.RateLimitError: Re-raised so callers can slow down and retry
         """
         try:
             logger.info(f"Processing document: {document_path}")
@@ -124,19 +135,78 @@ class RAGEngine:
             chunks_with_embeddings = self.embedding_generator.embed_chunks(chunks)
             logger.info(f"Generated embeddings for {len(chunks_with_embeddings)} chunks")
             
-            # 3. Add to vector store
-            doc_ids = self.vector_store.add_documents(chunks_with_embeddings)
-            logger.info(f"Added {len(doc_ids)} chunks to vector store")
-            
-            # 4. Save vector store
-            self.vector_store.save()
+            # 3. Add to vector store and 4. save it (one writer at a time)
+            with self._store_lock:
+                doc_ids = self.vector_store.add_documents(chunks_with_embeddings)
+                logger.info(f"Added {len(doc_ids)} chunks to vector store")
+                
+                self.vector_store.save()
             
             return chunks_with_embeddings
             
+        except openai.RateLimitError:
+            raise
         except Exception as e:
             logger.error(f"Error processing document {document_path}: {e}")
             return []
     
+    def process_documents(self,
+                          documents: List[Tuple[Path, Optional[str], Optional[Dict[str, Any]]]]) -> List[List[Dict[str, Any]]]:
+        """
+        Process several documents, embedding all of their chunks in one batched pass.
+        
+        Chunks from every document share embedding API requests, so many small
+        documents cost a few requests instead of one or more each.
+        
+        Args:
+            documents: (document_path, document_id, document_metadata) tuples
+            
+        Returns:
+            Processed chunks per document, in input order ([] for failures)
+            
+        Raises:
+            openai.RateLimitError: Re-raised so callers can slow down and retry
+        """
+        results = [[] for _ in documents]
+        chunked = []  # (input position, chunks)
+        
+        # 1. Chunk each document
+        for position, (document_path, document_id, _) in enumerate(documents):
+            try:
+                chunks = self.chunker.chunk_document_from_file(document_path, document_id or document_path.stem)
+                logger.info(f"Created {len(chunks)} chunks from document {document_id or document_path.stem}")
+                chunked.append((position, chunks))
+            except Exception as e:
+                logger.error(f"Error chunking document {document_path}: {e}")
+        
+        all_chunks = [chunk for _, chunks in chunked for chunk in chunks]
+        if not all_chunks:
+            return results
+        
+        try:
+            # 2. Generate embeddings for all chunks together
+            chunks_with_embeddings = self.embedding_generator.embed_chunks(all_chunks)
+            
+            # 3. Add to vector store and 4. save it once (one writer at a time)
+            with self._store_lock:
+                doc_ids = self.vector_store.add_documents(chunks_with_embeddings)
+                logger.info(f"Added {len(doc_ids)} chunks from {len(chunked)} documents to vector store")
+                
+                self.vector_store.save()
+                
+        except openai.RateLimitError:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing {len(documents)} documents: {e}")
+            return results
+        
+        # Split the embedded chunks back out per document
+        offset = 0
+        for position, chunks in chunked:
+            results[position] = chunks_with_embeddings[offset:offset + len(chunks)]
+            offset += len(chunks)
+        return results
+    
     def process_directory(self, 
                          directory_path: Path,
                          file_types: List[str] = None,